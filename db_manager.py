@@ -1,12 +1,22 @@
 
-from sqlalchemy.orm import sessionmaker
+import os
+import io
+import json
+import shutil
+import threading
+import time
+from itertools import islice
+from contextlib import contextmanager
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 from sqlalchemy import create_engine
 from sqlalchemy import text
 from sqlalchemy import types
+from sqlalchemy import func, cast, extract, literal_column, type_coerce
 import numpy as np
 import pandas as pd
 from datetime import datetime
-from sqlalchemy.sql.expression import any_, or_, join, between, and_
+from sqlalchemy.sql.expression import any_, or_, join, between, and_, union_all
 """
 join (left, right, onclause=None, isouter=False, full=False)
 j = join(user_table, address_table, user_table.c.id == address_table.c.user_id)
@@ -35,7 +45,7 @@ equivalent to
 from sqlalchemy import CheckConstraint
 
 from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy import Table, Column, Integer, String, Float, MetaData, ForeignKey, DateTime, Interval
+from sqlalchemy import Table, Column, Integer, String, Float, MetaData, ForeignKey, DateTime, Interval, BigInteger
 from sqlalchemy.sql import select
 
 from sqlalchemy.ext.declarative import declarative_base
@@ -45,10 +55,25 @@ from sqlalchemy.ext.declarative import declarative_base
 
 TIME_COL = 'TIME'
 CHUNK_SIZE = 10000
+SNAPSHOT_META = 'snapshot.json'
+PARTITION_NAME = '{table}_p{year:04d}{month:02d}'
+RESAMPLE_HOW = ['mean', 'min', 'max', 'last']
+ROLLUP_RESOLUTIONS = ['1min', '15min', '1h']
+ROLLUP_STATS = ['min', 'max', 'mean', 'count']
 
 class DBManager:
     
-    def __init__(self, db_url=None, db_type=None, client=None, user=None, password=None, ip=None, port=None, db=None):
+    def __init__(self, db_url=None, db_type=None, client=None, user=None, password=None, ip=None, port=None, db=None,
+                 poolSize=None, maxOverflow=10, poolPrePing=True):
+        """
+        db_url, str or None, sqlalchemy url, if None, built from db_type, client, user, password, ip, port and db
+        poolSize, int or None, if not None, pooled mode : the engine keeps a QueuePool of poolSize
+                connections (plus maxOverflow extra ones), every call checks out its own connection
+                and self.session is a thread local scoped_session, so that the instance can be
+                shared between threads
+        maxOverflow, int, connections allowed above poolSize in pooled mode
+        poolPrePing, boolean, test connections on checkout in pooled mode
+        """
 
         if db_url is None:
             engineStr = self.create_db_uri(db_type, client, user, password, ip, port, db)
@@ -57,7 +82,15 @@ class DBManager:
             self.engineStr = db_url
             
         self.metadata = MetaData()
-        engine = create_engine(self.engineStr)
+        self.pooled = poolSize is not None
+        if self.pooled:
+            # sqlite connections are bound to their creating thread unless told otherwise
+            connectArgs = {'check_same_thread': False} if self.engineStr.startswith('sqlite') else {}
+            engine = create_engine(self.engineStr, poolclass=QueuePool, pool_size=poolSize,
+                                   max_overflow=maxOverflow, pool_pre_ping=poolPrePing,
+                                   connect_args=connectArgs)
+        else:
+            engine = create_engine(self.engineStr)
         if not database_exists(engine.url):
             create_database(engine.url)
         self.engine = engine
@@ -65,14 +98,73 @@ class DBManager:
         # inspect db from metadata object
         self.metadata.reflect(self.engine)
         
-        session = sessionmaker(bind=engine)
-        self.session = session()
-        
-        connection = self.engine.connect()
-        self.conn = connection
+        self.sessionFactory = sessionmaker(bind=engine)
+        if self.pooled:
+            # one session per thread, connections are checked out per call, see connect
+            self.session = scoped_session(self.sessionFactory)
+            self.conn = None
+        else:
+            self.session = self.sessionFactory()
+            connection = self.engine.connect()
+            self.conn = connection
         
         # set to True when fast time query is ready
         self.hasResall = False
+        # table name : whether it is partitioned, see isPartitioned
+        self.partitioned = {}
+        # growable buffers behind resall, see appendResall
+        self.resallBuffers = None
+        self.resallLock = threading.Lock()
+        # held by a refresh from the read of the last TIME to the append, see refreshFastTimeQuery
+        self.refreshLock = threading.Lock()
+        self.refreshThread = None
+        self.refreshStop = None
+
+    @contextmanager
+    def connect(self):
+        """
+        brief : connection to use for one call
+        in pooled mode, a connection is checked out from the pool in a transaction,
+        committed and given back on exit, otherwise the shared connection is used
+        """
+        if self.pooled:
+            with self.engine.begin() as conn:
+                yield conn
+        else:
+            yield self.conn
+
+    @contextmanager
+    def sessionScope(self):
+        """
+        brief : new session, committed on success, rolled back on error, closed on exit
+        """
+        session = self.sessionFactory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def releaseSession(self):
+        """
+        brief : release the session of the current thread (pooled mode), e.g. at the end of a request
+        """
+        if self.pooled:
+            self.session.remove()
+        else:
+            self.session.close()
+
+    def dispose(self):
+        """
+        brief : close all the connections of the engine
+        """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.engine.dispose()
 
     @staticmethod
     def create_db_uri(db_type, client, user, password, ip, port, db):
@@ -129,22 +221,129 @@ class DBManager:
         else:
             raise ValueError('field {} was not found in table {}'.format(key, tableStr))
         
-        self.conn.execute(inst)
+        with self.connect() as conn:
+            conn.execute(inst)
         self.session.flush()
         self.session.close()
         self.metadata.create_all(self.engine)
     
-    def setIndex(self, tableName="sensors", col="TIME"):
+    def setIndex(self, tableName="sensors", col="TIME", indexName=None, unique=True):
         """
         brief : set index to table
+        tableName, str, table name
+        col, str, indexed column
+        indexName, str or None, name of the index, default is <tableName>_<col>_idx
+        unique, boolean, whether the index is unique
         """
+        if indexName is None:
+            indexName = '{}_{}_idx'.format(tableName, col).lower()
+        quote = self.engine.dialect.identifier_preparer.quote
         sql = text("""
-                   CREATE UNIQUE INDEX index_name ON {table_name} ( {col});
-        ;""".format(table_name=tableName, col=col))
-        self.conn.execute(sql)#session.execute(sql)
+                   CREATE {unique}INDEX IF NOT EXISTS {index_name} ON {table_name} ( {col});
+        """.format(unique='UNIQUE ' if unique else '', index_name=quote(indexName),
+                   table_name=quote(tableName), col=quote(col)))
+        with self.connect() as conn:
+            conn.execute(sql)#session.execute(sql)
         self.session.flush()
         self.session.close()
-    
+
+    def isPartitioned(self, tableName):
+        """
+        brief : whether the table is range partitioned (postgresql only)
+        """
+        if self.engine.dialect.name != 'postgresql':
+            return False
+        if tableName not in self.partitioned:
+            sql = text("""
+                       SELECT count(*) FROM pg_partitioned_table pt
+                       JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :t
+            """)
+            with self.connect() as conn:
+                self.partitioned[tableName] = conn.execute(sql, t=tableName).scalar() > 0
+        return self.partitioned[tableName]
+
+    def createPartitionedTable(self, tableName, dt):
+        """
+        brief : create a table partitioned by month on TIME (postgresql only)
+        tableName, str, table name
+        dt, pandas.DataFrame, frame giving the columns of the table
+        """
+        if self.engine.dialect.name != 'postgresql':
+            raise ValueError('partitioned tables are only supported on postgresql')
+        if tableName in self.tables:
+            raise FileExistsError(tableName)
+        quote = self.engine.dialect.identifier_preparer.quote
+        table = Table(tableName, self.metadata, *self.dataframeColumns(dt),
+                      postgresql_partition_by='RANGE ({})'.format(quote(TIME_COL)))
+        table.create(self.engine)
+        self.partitioned[tableName] = True
+
+    @staticmethod
+    def monthStarts(startDate, endDate):
+        """
+        brief : first day of every month between startDate and endDate (included)
+        returns, list[pandas.Timestamp]
+        """
+        start = pd.Timestamp(startDate).to_period('M').to_timestamp()
+        return list(pd.date_range(start, pd.Timestamp(endDate), freq='MS'))
+
+    @staticmethod
+    def partitionName(tableName, monthStart):
+        """
+        brief : name of the partition of tableName holding the month of monthStart
+        """
+        return PARTITION_NAME.format(table=tableName, year=monthStart.year, month=monthStart.month)
+
+    def listPartitions(self, tableName):
+        """
+        brief : names of the partitions of a partitioned table
+        returns, list[str], sorted
+        """
+        sql = text("""
+                   SELECT c.relname FROM pg_inherits i
+                   JOIN pg_class c ON c.oid = i.inhrelid
+                   JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :t
+        """)
+        with self.connect() as conn:
+            return sorted(r[0] for r in conn.execute(sql, t=tableName))
+
+    def ensurePartitions(self, tableName, startDate, endDate):
+        """
+        brief : create the monthly partitions covering [startDate, endDate], and the next month
+        returns, list[str], names of the partitions covering [startDate, endDate]
+        """
+        quote = self.engine.dialect.identifier_preparer.quote
+        months = self.monthStarts(startDate, endDate)
+        names = []
+        for month in months + [months[-1] + pd.DateOffset(months=1)]:
+            name = self.partitionName(tableName, month)
+            nextMonth = month + pd.DateOffset(months=1)
+            with self.engine.begin() as conn:
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS {part} PARTITION OF {table}
+                    FOR VALUES FROM ('{start}') TO ('{end}')
+                """.format(part=quote(name), table=quote(tableName),
+                           start=month.strftime('%Y-%m-%d'), end=nextMonth.strftime('%Y-%m-%d'))))
+            self.setIndex(name, TIME_COL)
+            names.append(name)
+        missing = [n for n in names if n not in self.tables]
+        if missing:
+            self.metadata.reflect(self.engine, only=missing)
+        return names[:len(months)]
+
+    def partitionsForWindow(self, tableName, startDate, endDate):
+        """
+        brief : existing partitions of tableName covering [startDate, endDate]
+        returns, list[str]
+        """
+        existing = set(self.listPartitions(tableName))
+        names = [self.partitionName(tableName, m) for m in self.monthStarts(startDate, endDate)]
+        names = [n for n in names if n in existing]
+        missing = [n for n in names if n not in self.tables]
+        if missing:
+            self.metadata.reflect(self.engine, only=missing)
+        return names
+
     def createTable(self, tableName, columns=[], tableConstraints=[]):# , force=True):
         """
         brief : create table in the db in use in this DBM instance (default db_s)
@@ -198,18 +397,64 @@ class DBManager:
             raise FileNotFoundError(tableStr)
         tble = self.tables[tableStr]
         ins = tble.insert().values(**kwargs)
-        self.conn.execute(ins)
+        with self.connect() as conn:
+            conn.execute(ins)
         self.session.flush()
         self.session.close()
         
     
+    def insertManyInTable(self, tableStr, rows, batchsize=CHUNK_SIZE):
+        """
+        brief : insert many rows into a table, by batches, in one transaction
+        tableStr, String, table name
+        rows, iterable of dict (column name : value) or numpy structured array
+        batchsize, int, number of rows sent per executemany
+        returns, int, number of rows inserted
+        """
+        if tableStr not in self.tables:
+            raise FileNotFoundError(tableStr)
+        tble = self.tables[tableStr]
+
+        if isinstance(rows, np.ndarray):
+            if rows.dtype.names is None:
+                raise TypeError('expected a structured array, got dtype {}'.format(rows.dtype))
+            batches = self.structuredBatches(rows, batchsize)
+        else:
+            rows = iter(rows)
+            batches = iter(lambda: list(islice(rows, batchsize)), [])
+
+        start = time.perf_counter()
+        count = 0
+        with self.engine.begin() as conn:
+            for batch in batches:
+                conn.execute(tble.insert(), batch)
+                count += len(batch)
+        elapsed = time.perf_counter() - start
+        print('{} rows inserted in {} in {:.2f}s ({:.0f} rows/s)'.format(
+            count, tableStr, elapsed, count / elapsed if elapsed > 0 else float('inf')))
+        return count
+
+    @staticmethod
+    def structuredBatches(arr, batchsize):
+        """
+        brief : yield lists of dicts from a numpy structured array, batchsize rows at a time
+        datetime64 fields are converted to datetime.datetime
+        """
+        names = arr.dtype.names
+        timeFields = [n for n in names if arr.dtype[n].kind == 'M']
+        for i in range(0, len(arr), batchsize):
+            cols = [arr[n][i:i + batchsize] for n in names]
+            cols = [c.astype('datetime64[us]') if n in timeFields else c for n, c in zip(names, cols)]
+            yield [dict(zip(names, r)) for r in zip(*[c.tolist() for c in cols])]
+
     def deleteTable(self,tablename):
         """
         brief : delete a table from db
         tablename : String, name of the table to delete
         """
         if tablename in self.tables:
-            del self.tables[tablename]
+            self.metadata.remove(self.tables[tablename])
+        self.partitioned.pop(tablename, None)
         sql = text('DROP TABLE IF EXISTS {};'.format(tablename))
         result = self.engine.execute(sql)
         self.session.flush()
@@ -229,7 +474,7 @@ class DBManager:
                     print('column: {:<20} type: {:<30} {:<30}'.format(c.name, str(c.type), str(primaryKey))) # c.description 
             
 
-    def timeQuery(self, startDate, endDate, tableStr="sensors", columns=None, limit=None):
+    def timeQuery(self, startDate, endDate, tableStr="sensors", columns=None, limit=None, resample=None, how="mean", points=None):
         """
         query using start and end datetime
         startDate, String of the form yyyy-mm-dd --:--:--, starting datetime
@@ -238,11 +483,30 @@ class DBManager:
         columns, list[String], restrict result to these columns, if None, then keep all columns
                             the time columns is handled separately
         limit, int or None, if not None, limit to number of rows to return
+        resample, str or None, if not None, size of the time buckets, e.g. "1min", "15min", "1h",
+                  rows of [startDate, endDate] (bounds included, as fastTimeQuery) are aggregated
+                  in the db (GROUP BY bucket) and TIME is the bucket start
+        how, str in RESAMPLE_HOW, aggregation used when resample is not None
+        points, int or None, if not None (and resample is None), number of points wanted in the window :
+                the coarsest rollup table (see updateRollups) still giving that many points is read
+                instead of the raw table, if there is one, from the bucket holding startDate to the
+                bucket starting at or before endDate
 
         Example: 
            timeQuery('2019-09-01 00:03:30', '2019-09-01 01:00:00', columns=['BC211ZP01', 'BC210ZP01'])
         """
 
+        # raw rows are read in ]startDate, endDate[, aggregated ones in [startDate, endDate]
+        inclusive = resample is not None
+        if points is not None and resample is None:
+            resolution = self.pickRollup(tableStr, startDate, endDate, points, how)
+            if resolution is not None:
+                print('reading rollup {} of {}'.format(resolution, tableStr))
+                tableStr = self.rollupName(tableStr, resolution, how)
+                # the bucket holding startDate starts at or before it
+                startDate = pd.Timestamp(startDate).floor(resolution).to_pydatetime()
+                inclusive = True
+
         # prepare list of smt columns
         smt = self.tables[tableStr]
         if columns is None:
@@ -252,59 +516,489 @@ class DBManager:
                 columns.remove('TIME')
             columns.insert(0, 'TIME')
             smtlist = [getattr(smt.c, col) for col in columns]
-        if limit is not None:
-            res = self.session.query(*smtlist).filter(and_(smt.c.TIME < endDate, smt.c.TIME > startDate)).limit(limit)
+        parts = []
+        if self.isPartitioned(tableStr):
+            parts = [self.tables[p] for p in self.partitionsForWindow(tableStr, startDate, endDate)]
+        if parts:
+            # only read the monthly partitions covering the window
+            sels = []
+            for p in parts:
+                plist = [p] if columns is None else [p.c[col] for col in columns]
+                sels.append(select(plist).where(self.timeWindow(p.c.TIME, startDate, endDate, inclusive)))
+            smt = union_all(*sels).alias(tableStr)
+            smtlist = [smt]
+
+        if resample is not None:
+            valueCols = [c for c in (columns if columns is not None else smt.columns.keys()) if c != TIME_COL]
+            res = self.resampleQuery(smt, startDate, endDate, valueCols, resample, how)
         else:
-            res = self.session.query(*smtlist).filter(and_(smt.c.TIME < endDate, smt.c.TIME > startDate))
+            res = self.session.query(*smtlist).filter(self.timeWindow(smt.c.TIME, startDate, endDate, inclusive))
+        if limit is not None:
+            res = res.limit(limit)
             
         #res = self.session.query(self.tables[tableStr])
-        self.session.close()
+        if not self.pooled:
+            self.session.close()
+        # in pooled mode, the query is lazy and bound to the session of this thread,
+        # which is released by releaseSession
         return res#.all()#self.convertResToArray(res)
+
+    @staticmethod
+    def timeWindow(col, startDate, endDate, inclusive=False):
+        """
+        brief : filter of col on ]startDate, endDate[, or on [startDate, endDate] if inclusive
+        startDate, endDate, datetime.datetime or str, compared as datetimes (sqlite stores
+                   datetimes as text, a str bound would be compared as text)
+        """
+        startDate = pd.Timestamp(startDate).to_pydatetime()
+        endDate = pd.Timestamp(endDate).to_pydatetime()
+        if inclusive:
+            return and_(col >= startDate, col <= endDate)
+        return and_(col < endDate, col > startDate)
+
+    def timeBucket(self, col, seconds):
+        """
+        brief : sql expression of the start of the time bucket of col, buckets of seconds
+                seconds, aligned on the epoch
+        col, sqlalchemy column of datetimes
+        seconds, int, size of the buckets
+        raises ValueError, if the db dialect is not supported
+        """
+        # literals are inlined so that the same expression can be repeated in GROUP BY
+        seconds = literal_column(str(int(seconds)))
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            sec = func.date_trunc(literal_column("'second'"), col)
+            offset = cast(extract('epoch', sec), BigInteger) % seconds
+            return sec - func.make_interval(0, 0, 0, 0, 0, 0, offset)
+        elif dialect == 'sqlite':
+            epoch = cast(func.strftime(literal_column("'%s'"), col), Integer)
+            return func.datetime((epoch / seconds) * seconds, literal_column("'unixepoch'"))
+        elif dialect == 'mysql':
+            return func.from_unixtime(func.floor(func.unix_timestamp(col) / seconds) * seconds)
+        else:
+            raise ValueError('resample is not supported for {}'.format(dialect))
+
+    def resampleQuery(self, smt, startDate, endDate, valueCols, resample, how="mean"):
+        """
+        brief : query of the rows of smt in [startDate, endDate] aggregated by time buckets
+        smt, table or subquery, valueCols, list[str], columns to aggregate
+        resample, str, bucket size, e.g. "1min", how, str in RESAMPLE_HOW
+        returns, query with a TIME column (bucket start) and one column per value column
+        """
+        if how not in RESAMPLE_HOW:
+            raise ValueError('how must be in {}, got {}'.format(RESAMPLE_HOW, how))
+        seconds = pd.Timedelta(resample).total_seconds()
+        if seconds < 1 or seconds != int(seconds):
+            raise ValueError('resample must be a whole number of seconds, got {}'.format(resample))
+        # the bucket is read back as a datetime, sqlite returns it as text otherwise
+        bucket = type_coerce(self.timeBucket(smt.c.TIME, seconds), DateTime)
+        window = self.timeWindow(smt.c.TIME, startDate, endDate, inclusive=True)
+
+        if how == "last":
+            # last row of each bucket : join the table on the max TIME of each bucket
+            last = select([bucket.label('bucket'), func.max(smt.c.TIME).label('last')]).where(window).group_by(bucket).alias('last_rows')
+            res = self.session.query(last.c.bucket.label(TIME_COL), *[smt.c[c] for c in valueCols])
+            return res.select_from(last).join(smt, smt.c.TIME == last.c.last).order_by(last.c.bucket)
+
+        agg = {'mean': func.avg, 'min': func.min, 'max': func.max}[how]
+        res = self.session.query(bucket.label(TIME_COL), *[agg(smt.c[c]).label(c) for c in valueCols])
+        return res.filter(window).group_by(bucket).order_by(bucket)
+
+    @staticmethod
+    def bucketReduce(times, values, step, how="mean"):
+        """
+        brief : aggregate sorted rows by time buckets, vectorized
+        times, numpy.ndarray of int64 (ns), sorted
+        values, numpy.ndarray of shape (len(times), k)
+        step, int, bucket size in ns, buckets are aligned on the epoch
+        how, str in RESAMPLE_HOW or "count", nan values are ignored
+        returns, (numpy.ndarray of datetime64[ns], numpy.ndarray of shape (number of buckets, k))
+        """
+        if how not in RESAMPLE_HOW + ['count']:
+            raise ValueError('how must be in {}, got {}'.format(RESAMPLE_HOW, how))
+        buckets = times // step
+        if len(times) == 0:
+            return buckets.view('datetime64[ns]'), values[:0]
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        bucketTimes = (buckets[starts] * step).view('datetime64[ns]')
+        if how == "min":
+            return bucketTimes, np.fmin.reduceat(values, starts, axis=0)
+        elif how == "max":
+            return bucketTimes, np.fmax.reduceat(values, starts, axis=0)
+        elif how == "last":
+            return bucketTimes, values[np.r_[starts[1:], len(times)] - 1]
+        valid = ~np.isnan(values)
+        counts = np.add.reduceat(valid.astype('<i8'), starts, axis=0)
+        if how == "count":
+            return bucketTimes, counts
+        sums = np.add.reduceat(np.where(valid, values, 0).astype('<f8'), starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return bucketTimes, sums / counts
     
-    def initFastTimeQuery(self, tableStr="sensors", columns=None, limit=None):
+    def initFastTimeQuery(self, tableStr="sensors", columns=None, limit=None, stream=False, chunksize=CHUNK_SIZE, cacheDir=None):
         """
         query all the table
+        tableStr, str, table name
+        columns, None or list of str, columns to load (TIME is always loaded), if None, all columns
+        limit, int or None, if not None, maximum number of rows to load
+        stream, boolean, if True, rows are fetched by batches of chunksize with a server side
+                cursor and written into preallocated numpy columns (TIME in datetime64, all the
+                other columns in float32), peak memory stays close to the final frame size
+        chunksize, int, number of rows per fetch in stream mode
+        cacheDir, None or str, if not None, folder of an on disk snapshot of the table (implies stream),
+                the snapshot is memory mapped and only the rows newer than its watermark are fetched
         """
         print('starting init for fast time queries')
+        if cacheDir is not None:
+            if limit is not None:
+                raise ValueError('cacheDir cannot be used with a limit')
+            times, values, cols = self.loadSnapshot(cacheDir, tableStr, columns=columns, chunksize=chunksize)
+            self.setResallArrays(times, values, cols, tableStr)
+            print('init for fast time queries completed')
+            return
+        if stream:
+            times, values, cols = self.loadTableArrays(tableStr, columns=columns, limit=limit, chunksize=chunksize)
+            self.setResallArrays(times, values, cols, tableStr)
+            print('init for fast time queries completed')
+            return
         smt = self.tables[tableStr]
-        smtlist = [smt]
+        if columns is None:
+            smtlist = [smt]
+            cols = list(smt.columns.keys())
+        else:
+            cols = [TIME_COL] + [c for c in columns if c != TIME_COL]
+            smtlist = [smt.c[c] for c in cols]
         res = self.session.query(*smtlist)
+        if limit is not None:
+            res = res.limit(limit)
         print('running res.all()')
         #resall = res.all()
-        cols = list(self.tables[tableStr].columns.keys())
         print("running dataframe.from_records")
         resall = pd.DataFrame(res, columns=cols)# .from_records.( , coerce_float=True) #
-        self.resall = resall
-        self.hasResall = True
+        self.setResall(resall, tableStr)
         print('init for fast time queries completed')
 
-    def fastTimeQuery(self, startDate, endDate, tableStr="sensors", columns=None, to=None, filePath=None):
+    def loadTableArrays(self, tableStr="sensors", columns=None, limit=None, where=None, chunksize=CHUNK_SIZE):
+        """
+        brief : stream a table into preallocated typed numpy columns
+        tableStr, str, table name
+        columns, None or list of str, columns to load besides TIME, if None, all columns
+        limit, int or None, maximum number of rows to load
+        where, sqlalchemy expression or None, additional filter on the rows
+        chunksize, int, number of rows per fetchmany
+        returns, (numpy.ndarray, numpy.ndarray, list[str]) :
+                TIME sorted as datetime64[ns] of shape (n,),
+                values as float32 of shape (n, len(cols)) in column major order,
+                names of the value columns
+        """
+        smt = self.tables[tableStr]
+        if columns is None:
+            cols = [c for c in smt.columns.keys() if c != TIME_COL]
+        else:
+            cols = [c for c in columns if c != TIME_COL]
+        smtlist = [smt.c[TIME_COL]] + [smt.c[c] for c in cols]
+
+        countQuery = select([func.count()]).select_from(smt)
+        query = select(smtlist).order_by(smt.c[TIME_COL])
+        if where is not None:
+            countQuery = countQuery.where(where)
+            query = query.where(where)
+        if limit is not None:
+            query = query.limit(limit)
+
+        conn = self.engine.connect().execution_options(stream_results=True)
+        try:
+            capacity = conn.execute(countQuery).scalar()
+            if limit is not None:
+                capacity = min(capacity, limit)
+            times = np.empty(capacity, dtype='datetime64[ns]')
+            # column major : each column is contiguous, the frame built on top is not copied
+            values = np.empty((capacity, len(cols)), dtype='float32', order='F')
+            pos = 0
+            result = conn.execute(query)
+            while True:
+                rows = result.fetchmany(chunksize)
+                if not rows:
+                    break
+                n = len(rows)
+                if pos + n > capacity:
+                    # rows were added since the count
+                    capacity = max(2 * capacity, pos + n)
+                    times, values = self.growArrays(times, values, pos, capacity)
+                times[pos:pos + n] = [r[0] for r in rows]
+                values[pos:pos + n] = [tuple(r)[1:] for r in rows]
+                pos += n
+        finally:
+            conn.close()
+        print('{} rows loaded from {}'.format(pos, tableStr))
+        return times[:pos], values[:pos], cols
+
+    def loadSnapshot(self, cacheDir, tableStr="sensors", columns=None, chunksize=CHUNK_SIZE):
+        """
+        brief : load a table from its on disk snapshot, refreshing the snapshot if needed
+        cacheDir, str, folder holding one snapshot per table
+        tableStr, str, table name
+        columns, None or list of str, columns to load besides TIME, if None, all columns
+        the snapshot is keyed by the table name and a watermark (max TIME, row count) :
+            - same columns and same rows up to the watermark in db : the snapshot is memory
+              mapped and only the rows with TIME > watermark are fetched
+            - otherwise the whole table is streamed again
+        the snapshot is rewritten when rows were fetched from the db
+        returns, same as loadTableArrays
+        """
+        smt = self.tables[tableStr]
+        if columns is None:
+            cols = [c for c in smt.columns.keys() if c != TIME_COL]
+        else:
+            cols = [c for c in columns if c != TIME_COL]
+        snapshotPath = os.path.join(cacheDir, tableStr)
+        metaPath = os.path.join(snapshotPath, SNAPSHOT_META)
+
+        meta = None
+        if os.path.isfile(metaPath):
+            with open(metaPath, 'r') as of:
+                meta = json.load(of)
+            if meta['columns'] != cols:
+                print('snapshot {} has other columns, will be rebuilt'.format(snapshotPath))
+                meta = None
+        if meta is not None and meta['rowCount'] > 0:
+            watermark = pd.Timestamp(meta['maxTime']).to_pydatetime()
+            check = select([func.count(), func.max(smt.c[TIME_COL])]).where(smt.c[TIME_COL] <= watermark)
+            with self.connect() as conn:
+                dbCount, dbMax = conn.execute(check).fetchone()
+            if dbCount != meta['rowCount'] or pd.Timestamp(dbMax).value != meta['maxTime']:
+                print('snapshot {} is out of date, will be rebuilt'.format(snapshotPath))
+                meta = None
+
+        if meta is None:
+            times, values, cols = self.loadTableArrays(tableStr, columns=cols, chunksize=chunksize)
+            self.saveSnapshot(snapshotPath, tableStr, times, values, cols)
+            return times, values, cols
+
+        times = np.load(os.path.join(snapshotPath, 'TIME.npy'), mmap_mode='r').view('datetime64[ns]')
+        values = np.load(os.path.join(snapshotPath, 'VALUES.npy'), mmap_mode='r')
+        print('snapshot {} loaded, {} rows'.format(snapshotPath, len(times)))
+        where = None
+        if meta['rowCount'] > 0:
+            where = smt.c[TIME_COL] > pd.Timestamp(meta['maxTime']).to_pydatetime()
+        newTimes, newValues, _ = self.loadTableArrays(tableStr, columns=cols, where=where, chunksize=chunksize)
+        if len(newTimes) > 0:
+            print('{} new rows since the snapshot'.format(len(newTimes)))
+            times = np.concatenate([times, newTimes])
+            values = np.concatenate([values, newValues])
+            self.saveSnapshot(snapshotPath, tableStr, times, values, cols)
+        return times, values, cols
+
+    @staticmethod
+    def saveSnapshot(snapshotPath, tableStr, times, values, cols):
+        """
+        brief : write a table snapshot, one .npy file for TIME (int64 ns) and one column major
+                float32 .npy file for the values, plus a json file for the watermark
+        the snapshot is written in a temporary folder, then swapped with the previous one
+        """
+        tmpPath = snapshotPath + '.tmp'
+        if os.path.exists(tmpPath):
+            shutil.rmtree(tmpPath)
+        os.makedirs(tmpPath)
+        np.save(os.path.join(tmpPath, 'TIME.npy'), np.ascontiguousarray(times).view('<i8'))
+        np.save(os.path.join(tmpPath, 'VALUES.npy'), np.asfortranarray(values))
+        meta = {'table': tableStr,
+                'columns': list(cols),
+                'rowCount': len(times),
+                'maxTime': int(times[-1].view('<i8')) if len(times) > 0 else None}
+        with open(os.path.join(tmpPath, SNAPSHOT_META), 'w') as of:
+            json.dump(meta, of)
+
+        oldPath = snapshotPath + '.old'
+        if os.path.exists(snapshotPath):
+            if os.path.exists(oldPath):
+                shutil.rmtree(oldPath)
+            os.rename(snapshotPath, oldPath)
+        os.rename(tmpPath, snapshotPath)
+        if os.path.exists(oldPath):
+            shutil.rmtree(oldPath)
+        print('snapshot of {} saved in {}'.format(tableStr, snapshotPath))
+
+    @staticmethod
+    def growArrays(times, values, size, capacity):
+        """
+        brief : reallocate time and value arrays to a given capacity, keeping the first size rows
+        """
+        newTimes = np.empty(capacity, dtype=times.dtype)
+        newValues = np.empty((capacity, values.shape[1]), dtype=values.dtype, order='F')
+        newTimes[:size] = times[:size]
+        newValues[:size] = values[:size]
+        return newTimes, newValues
+
+    @staticmethod
+    def arraysToFrame(times, values, cols):
+        """
+        brief : wrap time and value arrays in a dataframe without copying them
+        """
+        # insert would copy TIME, concat without copy keeps both arrays as the blocks of the frame
+        timeFrame = pd.DataFrame({TIME_COL: times}, copy=False)
+        return pd.concat([timeFrame, pd.DataFrame(values, columns=cols, copy=False)], axis=1, copy=False)
+
+    def setResall(self, resall, tableStr="sensors"):
+        """
+        brief : set the in memory dataframe used by fastTimeQuery and build its time index
+        resall, pandas.DataFrame, frame with a TIME column
+        tableStr, str, table the frame was loaded from, used by refreshFastTimeQuery
+        the frame is sorted on TIME once, the time index is the int64 (ns) view of the
+        sorted TIME column, so that windows are found with a binary search
+        """
+        if not np.issubdtype(resall[TIME_COL].dtype, np.datetime64):
+            resall[TIME_COL] = pd.to_datetime(resall[TIME_COL])
+        if not resall[TIME_COL].is_monotonic_increasing:
+            resall = resall.sort_values(TIME_COL, kind='mergesort').reset_index(drop=True)
+        with self.resallLock:
+            self.resall = resall
+            self.resallTime = resall[TIME_COL].to_numpy(dtype='datetime64[ns]').view('<i8')
+            self.resallTable = tableStr
+            self.resallCols = [c for c in resall.columns if c != TIME_COL]
+            self.resallBuffers = None
+            self.hasResall = True
+
+    def setResallArrays(self, times, values, cols, tableStr="sensors"):
+        """
+        brief : same as setResall, from the arrays (sorted on TIME) returned by loadTableArrays,
+                the arrays are kept as the buffers of the frame
+        """
+        self.setResall(self.arraysToFrame(times, values, cols), tableStr)
+        with self.resallLock:
+            self.resallBuffers = [times, values, len(times)]
+
+    def appendResall(self, times, values):
+        """
+        brief : append rows (sorted, newer than resall) to the in memory frame
+        times, numpy.ndarray of datetime64[ns], values, numpy.ndarray of shape (n, len(resallCols))
+        the rows are written in preallocated buffers whose capacity doubles when full,
+        so appending costs O(n) amortized, the frame is then rewrapped around the buffers
+        """
+        with self.resallLock:
+            if self.resallBuffers is None:
+                bufTimes = self.resall[TIME_COL].to_numpy(dtype='datetime64[ns]')
+                bufValues = np.asfortranarray(self.resall[self.resallCols].to_numpy(dtype='float32'))
+                self.resallBuffers = [bufTimes, bufValues, len(bufTimes)]
+            bufTimes, bufValues, size = self.resallBuffers
+            n = len(times)
+            # memory mapped snapshots are read only : they are copied on the first append
+            if size + n > len(bufTimes) or not bufValues.flags.writeable:
+                capacity = max(2 * len(bufTimes), size + n)
+                bufTimes, bufValues = self.growArrays(bufTimes, bufValues, size, capacity)
+            bufTimes[size:size + n] = times
+            bufValues[size:size + n] = values
+            size += n
+            self.resallBuffers = [bufTimes, bufValues, size]
+            self.resall = self.arraysToFrame(bufTimes[:size], bufValues[:size], self.resallCols)
+            self.resallTime = bufTimes[:size].view('<i8')
+
+    def refreshFastTimeQuery(self, chunksize=CHUNK_SIZE):
+        """
+        brief : fetch the rows newer than the last TIME of the in memory frame and append them
+        chunksize, int, number of rows per fetch
+        returns, int, number of rows added
+        """
+        if not self.hasResall:
+            raise ValueError('fast time query is not initialized, call initFastTimeQuery first')
+        smt = self.tables[self.resallTable]
+        # two concurrent refreshes would fetch and append the same rows, queries are not blocked
+        with self.refreshLock:
+            where = None
+            if len(self.resallTime) > 0:
+                lastTime = pd.Timestamp(int(self.resallTime[-1])).to_pydatetime()
+                where = smt.c[TIME_COL] > lastTime
+            times, values, _ = self.loadTableArrays(self.resallTable, columns=self.resallCols, where=where, chunksize=chunksize)
+            if len(times) > 0:
+                self.appendResall(times, values)
+                print('{} rows added to the fast time query frame'.format(len(times)))
+        return len(times)
+
+    def startFastTimeQueryRefresh(self, interval=60):
+        """
+        brief : refresh the in memory frame every interval seconds in a background thread
+        interval, float, seconds between two refreshes
+        """
+        if self.refreshThread is not None:
+            raise ValueError('refresh thread already started')
+        self.refreshStop = threading.Event()
+
+        def refreshLoop(stop):
+            while not stop.wait(interval):
+                try:
+                    self.refreshFastTimeQuery()
+                except Exception as e:
+                    print('WARNING : fast time query refresh failed : ', e)
+
+        self.refreshThread = threading.Thread(target=refreshLoop, args=(self.refreshStop,), daemon=True)
+        self.refreshThread.start()
+
+    def stopFastTimeQueryRefresh(self):
+        """
+        brief : stop the background refresh thread
+        """
+        if self.refreshThread is None:
+            return
+        self.refreshStop.set()
+        self.refreshThread.join()
+        self.refreshThread = None
+        self.refreshStop = None
+
+    @staticmethod
+    def toTimeInt(date):
+        """
+        brief : convert a date to the int64 (ns) representation used by the time index
+        date, datetime.datetime, numpy.datetime64 or str of the form yyyy-mm-dd --:--:--
+        raises TypeError, when date is of none of these types
+        """
+        if isinstance(date, str):
+            date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+        elif not isinstance(date, (datetime, np.datetime64)):
+            raise TypeError(date)
+        return np.datetime64(date, 'ns').astype('<i8')
+
+    def timeSlice(self, startDate, endDate, resallTime=None):
+        """
+        brief : positions of the rows of resall within [startDate, endDate]
+        resallTime, numpy.ndarray or None, time index to search, default is self.resallTime
+        returns, (int, int), start and stop positions, O(log N)
+        """
+        if resallTime is None:
+            resallTime = self.resallTime
+        i0 = np.searchsorted(resallTime, self.toTimeInt(startDate), side='left')
+        i1 = np.searchsorted(resallTime, self.toTimeInt(endDate), side='right')
+        return i0, i1
+
+    def fastTimeQuery(self, startDate, endDate, tableStr="sensors", columns=None, to=None, filePath=None, resample=None, how="mean"):
         """
         brief : rapid table query using in memory dataframe
-        startDate, endDate: python datetime.datetime, start and end time
+        startDate, endDate: python datetime.datetime or str, start and end time (both included)
         tableStr, str, table to query, sensrs is default
         columns, None or list of str, columns to retrieve,
         to, None or "json" or "csv", format of output
         file_path, None or str, is to is not None, path for the output
+        resample, str or None, if not None, size of the time buckets, e.g. "1min", "15min", "1h",
+                  TIME is then the bucket start, see bucketReduce
+        how, str in RESAMPLE_HOW, aggregation used when resample is not None
         """
         if not self.hasResall:
             print('the db will be put in python object for speed issues')
             self.initFastTimeQuery()
-        if not isinstance(startDate, datetime):
-            if isinstance(startDate, str):
-                startDate = datetime.strptime(startDate,"%Y-%m-%d %H:%M:%S")
-            else:
-                raise TypeError(startDate)
-        if not isinstance(startDate, datetime):
-            if isinstance(endDate, str):
-                endDate = datetime.strptime(startDate,"%Y-%m-%d %H:%M:%S")
-            else:
-                raise TypeError(endDate)
-                
+        # frame and index are swapped together by refreshFastTimeQuery
+        with self.resallLock:
+            resall, resallTime = self.resall, self.resallTime
+        i0, i1 = self.timeSlice(startDate, endDate, resallTime)
         if columns is not None:
-            res = self.resall[(self.resall['TIME'] >= startDate) & (self.resall['TIME'] <= endDate)][columns]
+            res = resall.iloc[i0:i1][columns]
         else:
-            res = self.resall[(self.resall['TIME'] >= startDate) & (self.resall['TIME'] <= endDate)]
+            # row slice of the sorted frame, a view : no copy
+            res = resall.iloc[i0:i1]
+        if resample is not None:
+            valueCols = [c for c in res.columns if c != TIME_COL]
+            step = pd.Timedelta(resample).value
+            bucketTimes, agg = self.bucketReduce(resallTime[i0:i1], res[valueCols].to_numpy(dtype='float64'), step, how)
+            res = self.arraysToFrame(bucketTimes, agg, valueCols)
         if to is not None:
             if to=="json":
                 if filePath is None:
@@ -363,7 +1057,8 @@ class DBManager:
         sql = text('delete from {} where true ;'.format(tableStr))
         print('inside emptyTable method, sql query is : ')
         print(sql)
-        self.conn.execute(sql)
+        with self.connect() as conn:
+            conn.execute(sql)
     
     
     def evalQueryStr(self ):
@@ -405,7 +1100,7 @@ class DBManager:
         #         pass
         
 
-    def importFromDataframe(self, dt, tableName, ifExists='replace', chunksize=CHUNK_SIZE):
+    def importFromDataframe(self, dt, tableName, ifExists='replace', chunksize=CHUNK_SIZE, method=None, partitionBy=None, rollups=None):
         """
         brief : import a pandas dataframe to the table
         dt, pandas.Dataframe, dt to be imported
@@ -413,7 +1108,18 @@ class DBManager:
         append, 'fail' : Raise ValueError if table exists,
                 'replace' : Drop the table before inserting,
                 'append' : insert new values to th existing table
+        method, None or "copy", if "copy", bulk load with copyFromDataframe
+        partitionBy, None or "month", if "month", the table is created partitioned by month on TIME
+                (postgresql only), rows are then written directly in their monthly partition,
+                partitions (and the next one) are created when needed, which is also the case
+                when appending to a table which is already partitioned
+        rollups, None or list[str], resolutions (e.g. ROLLUP_RESOLUTIONS) of the rollup tables
+                maintained alongside the table, see updateRollups
         """
+        if partitionBy not in [None, "month"]:
+            raise ValueError(partitionBy)
+        if method not in [None, "copy"]:
+            raise ValueError(method)
         
         if ifExists=="fail" and tableName in self.tables:
             raise ValueError(tableName)
@@ -422,24 +1128,244 @@ class DBManager:
                 self.deleteTable(tableName)
         elif ifExists!='append':
             raise ValueError(ifExists)
-        
-        cols = dt.columns
-        
-        dtpe = {c : types.Numeric(precision=4) for c in cols}
-        dtpe.update({'TIME': types.DATETIME()})
-        print('len of dtpe is ', len(dtpe))
-        print('len of dt.columns', len(dt.columns))
-        
-        #strDtype = 'M8, ' + 'f8, '*(len(cols)-2) + 'f8'
-        #dtpe = np.dtype(strDtype)
-        dt.to_sql(tableName, self.engine, index=False, dtype=dtpe, if_exists=ifExists, chunksize=chunksize)#index=True, index_label="TIME"
-        
-        self.session.flush()
-        self.session.close()
-        self.metadata.create_all(self.engine)
+
+        if partitionBy == "month" and tableName not in self.tables:
+            self.createPartitionedTable(tableName, dt)
+        if tableName in self.tables and self.isPartitioned(tableName):
+            self.importIntoPartitions(dt, tableName, chunksize=chunksize, method=method)
+        elif method == "copy":
+            self.copyFromDataframe(dt, tableName, chunksize=chunksize)
+        else:
+            cols = dt.columns
+            
+            dtpe = {c : types.Numeric(precision=4) for c in cols}
+            dtpe.update({'TIME': types.DATETIME()})
+            print('len of dtpe is ', len(dtpe))
+            print('len of dt.columns', len(dt.columns))
+            
+            #strDtype = 'M8, ' + 'f8, '*(len(cols)-2) + 'f8'
+            #dtpe = np.dtype(strDtype)
+            dt.to_sql(tableName, self.engine, index=False, dtype=dtpe, if_exists=ifExists, chunksize=chunksize)#index=True, index_label="TIME"
+            
+            self.session.flush()
+            self.session.close()
+            self.metadata.create_all(self.engine)
+            self.metadata.reflect(self.engine)
+            #self.setIndex(tableName=tableName)
+
+        if rollups is not None:
+            self.updateRollups(dt, tableName, rollups, ifExists=ifExists, chunksize=chunksize)
+
+    @staticmethod
+    def rollupName(tableName, resolution, stat):
+        """
+        brief : name of the rollup table of tableName for a resolution (e.g. "1min") and a stat in ROLLUP_STATS
+        """
+        return '{}_{}_{}'.format(tableName, resolution, stat).lower()
+
+    def updateRollups(self, dt, tableName, resolutions=ROLLUP_RESOLUTIONS, ifExists='append', chunksize=CHUNK_SIZE):
+        """
+        brief : maintain the rollup tables of tableName with the rows of dt
+        dt, pandas.DataFrame, rows just imported in tableName
+        resolutions, list[str], bucket sizes, e.g. ["1min", "15min", "1h"]
+        ifExists, str, if 'replace', the rollup tables are rebuilt from dt only
+        there is one rollup table per resolution and per stat in ROLLUP_STATS (min, max, mean, count),
+        each with the columns of tableName as DOUBLE PRECISION, TIME being the bucket start, see rollupName
+        when appending, buckets already in the rollup tables are merged with the new ones, the stored
+        buckets of the window are replaced in a single transaction for all the stats of a resolution
+        """
+        valueCols = [c for c in dt.columns if c != TIME_COL and np.issubdtype(dt[c].dtype, np.number)]
+        times = pd.to_datetime(dt[TIME_COL]).to_numpy(dtype='datetime64[ns]').view('<i8')
+        order = np.argsort(times, kind='mergesort')
+        times = times[order]
+        values = dt[valueCols].to_numpy(dtype='float64')[order]
+
+        for resolution in resolutions:
+            step = pd.Timedelta(resolution).value
+            new = {}
+            for stat in ROLLUP_STATS:
+                bucketTimes, agg = self.bucketReduce(times, values, step, stat)
+                new[stat] = pd.DataFrame(agg, index=pd.DatetimeIndex(bucketTimes, name=TIME_COL), columns=valueCols)
+            names = {stat: self.rollupName(tableName, resolution, stat) for stat in ROLLUP_STATS}
+            append = ifExists == 'append' and all(n in self.tables for n in names.values())
+            if not append:
+                template = new['count'].reset_index().astype({c: 'float64' for c in valueCols})
+                for name in names.values():
+                    if name in self.tables:
+                        self.deleteTable(name)
+                    Table(name, self.metadata, *self.dataframeColumns(template)).create(self.engine)
+            window = None
+            if append and len(times) > 0:
+                window = (pd.Timestamp(bucketTimes[0]).to_pydatetime(), pd.Timestamp(bucketTimes[-1]).to_pydatetime())
+                new = self.mergeRollups(new, names, window)
+            with self.engine.begin() as conn:
+                for stat in ROLLUP_STATS:
+                    tble = self.tables[names[stat]]
+                    if window is not None:
+                        conn.execute(tble.delete().where(and_(tble.c.TIME >= window[0], tble.c.TIME <= window[1])))
+                    frame = new[stat].reset_index()
+                    frame[TIME_COL] = frame[TIME_COL].dt.to_pydatetime()
+                    rows = frame.astype(object).where(frame.notna(), None).to_dict('records')
+                    for i in range(0, len(rows), chunksize):
+                        conn.execute(tble.insert(), rows[i:i + chunksize])
+            print('rollup {} of {} updated, {} buckets'.format(resolution, tableName, len(new['count'])))
+
+    def mergeRollups(self, new, names, window):
+        """
+        brief : merge new rollup buckets with the ones stored in window, the merged buckets are returned,
+                the caller replaces the stored ones
+        new, dict, stat : dataframe indexed by bucket start
+        names, dict, stat : rollup table name
+        window, tuple of datetime, first and last bucket start of new
+        """
+        old = {}
+        for stat, name in names.items():
+            tble = self.tables[name]
+            where = and_(tble.c.TIME >= window[0], tble.c.TIME <= window[1])
+            old[stat] = pd.read_sql(select([tble]).where(where), self.engine, index_col=TIME_COL, parse_dates=[TIME_COL])
+        if len(old['count']) == 0:
+            return new
+
+        cols = new['count'].columns
+        idx = new['count'].index.union(old['count'].index)
+        def align(frame):
+            return frame.reindex(index=idx, columns=cols).astype('float64')
+        newCount, oldCount = align(new['count']).fillna(0), align(old['count']).fillna(0)
+        count = newCount + oldCount
+        merged = {'count': count,
+                  'min': pd.DataFrame(np.fmin(align(new['min']).to_numpy(), align(old['min']).to_numpy()), index=idx, columns=cols),
+                  'max': pd.DataFrame(np.fmax(align(new['max']).to_numpy(), align(old['max']).to_numpy()), index=idx, columns=cols),
+                  'mean': ((align(new['mean']).fillna(0) * newCount + align(old['mean']).fillna(0) * oldCount) / count).where(count > 0)}
+        for frame in merged.values():
+            frame.index.name = TIME_COL
+        return merged
+
+    def rollupResolutions(self, tableName, how="mean"):
+        """
+        brief : resolutions of the rollup tables of tableName found in the db for the stat how,
+                ROLLUP_RESOLUTIONS or custom ones, see rollupName
+        returns, list[str]
+        """
+        prefix = '{}_'.format(tableName).lower()
+        suffix = '_{}'.format(how)
+        resolutions = []
+        for name in self.tables:
+            if not (name.startswith(prefix) and name.endswith(suffix)):
+                continue
+            resolution = name[len(prefix):-len(suffix)]
+            try:
+                pd.Timedelta(resolution)
+            except ValueError:
+                continue
+            resolutions.append(resolution)
+        return resolutions
+
+    def pickRollup(self, tableName, startDate, endDate, points, how="mean"):
+        """
+        brief : coarsest rollup resolution of tableName giving at least points buckets in the window
+        returns, str or None, resolution, None if no rollup table fits
+        """
+        if how not in ROLLUP_STATS:
+            return None
+        window = pd.Timestamp(endDate) - pd.Timestamp(startDate)
+        best = None
+        for resolution in self.rollupResolutions(tableName, how):
+            step = pd.Timedelta(resolution)
+            if window / step >= points and (best is None or step > pd.Timedelta(best)):
+                best = resolution
+        return best
+
+    def importIntoPartitions(self, dt, tableName, chunksize=CHUNK_SIZE, method=None):
+        """
+        brief : import a dataframe in the monthly partitions of a partitioned table
+        only the partitions covered by the TIME range of dt are written
+        """
+        if len(dt) == 0:
+            return
+        times = pd.to_datetime(dt[TIME_COL])
+        self.ensurePartitions(tableName, times.min(), times.max())
+        for month, part in dt.groupby(times.dt.to_period('M'), sort=True):
+            name = self.partitionName(tableName, month.to_timestamp())
+            print('importing {} rows in partition {}'.format(len(part), name))
+            if method == "copy":
+                self.copyFromDataframe(part, name, chunksize=chunksize)
+            else:
+                part.to_sql(name, self.engine, index=False, if_exists='append', chunksize=chunksize)
         self.metadata.reflect(self.engine)
-        #self.setIndex(tableName=tableName)
-    
+
+    @staticmethod
+    def dataframeColumns(dt):
+        """
+        brief : columns for a table holding a dataframe, TIME is DateTime,
+                float32 columns are REAL, other numeric columns DOUBLE PRECISION, others TEXT
+        returns, list[Column]
+        """
+        cols = []
+        for c in dt.columns:
+            if c == TIME_COL:
+                colType = types.DateTime()
+            elif dt[c].dtype == np.float32:
+                colType = types.REAL()
+            elif np.issubdtype(dt[c].dtype, np.number):
+                colType = types.Float(precision=53)
+            else:
+                colType = types.Text()
+            cols.append(Column(c, colType))
+        return cols
+
+    def copyFromDataframe(self, dt, tableName, chunksize=CHUNK_SIZE):
+        """
+        brief : bulk load a pandas dataframe into a table
+        dt, pandas.Dataframe, dt to be imported
+        tableName, str, table where to import, created if it does not exist
+        chunksize, int, number of rows sent per COPY (postgresql) or executemany (other db)
+        if the table is created : float32 columns are REAL, other numeric columns DOUBLE PRECISION,
+        and the TIME primary key (unique index on sqlite) is only built after the load
+        on postgresql, rows are streamed as csv into COPY ... FROM STDIN,
+        on other db, rows are inserted with executemany, all in one transaction
+        """
+        created = tableName not in self.tables
+        if created:
+            Table(tableName, self.metadata, *self.dataframeColumns(dt)).create(self.engine)
+        tble = self.tables[tableName]
+
+        start = datetime.now()
+        if self.engine.dialect.name == 'postgresql':
+            quote = self.engine.dialect.identifier_preparer.quote
+            copySql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                quote(tableName), ', '.join(quote(c) for c in dt.columns))
+            raw = self.engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                for i in range(0, len(dt), chunksize):
+                    buf = io.StringIO()
+                    dt.iloc[i:i + chunksize].to_csv(buf, index=False, header=False,
+                                                    date_format='%Y-%m-%d %H:%M:%S.%f')
+                    buf.seek(0)
+                    cursor.copy_expert(copySql, buf)
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+            finally:
+                raw.close()
+        else:
+            records = (r for i in range(0, len(dt), chunksize) for r in dt.iloc[i:i + chunksize].to_dict('records'))
+            self.insertManyInTable(tableName, records, batchsize=chunksize)
+        print('{} rows loaded in {} in {}'.format(len(dt), tableName, datetime.now() - start))
+
+        if created and TIME_COL in dt.columns:
+            if self.engine.dialect.name == 'postgresql':
+                sql = 'ALTER TABLE {} ADD PRIMARY KEY ({})'
+            else:
+                sql = 'CREATE UNIQUE INDEX ' + '{}_time_idx'.format(tableName) + ' ON {} ({})'
+            quote = self.engine.dialect.identifier_preparer.quote
+            with self.engine.begin() as conn:
+                conn.execute(text(sql.format(quote(tableName), quote(TIME_COL))))
+
+        self.metadata.remove(tble)
+        self.metadata.reflect(self.engine)
+
     #def groubByInterval
         
     # def __del__(self):
@@ -5,16 +5,291 @@ import h5py
 import numpy
 import pandas as pd
 import os
+import tempfile
+
+# optional, provides the Blosc filter
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+
+# number of rows per chunk of each dataset
+CHUNK_SIZE = 65536
+COMPRESSIONS = [None, 'gzip', 'lzf', 'blosc']
+LAYOUTS = ['columns', 'block']
+# block layout : name of the 2-D (time, sensor) dataset, and number of sensors per chunk
+BLOCK_DATASET = 'VALUES'
+BLOCK_CHUNK_COLS = 64
+# sparse columns : nan gaps shorter than this number of rows are stored as nan
+SPARSE_MIN_GAP = 64
+# storage of the sensor columns, see inferCodec
+CODECS = ['float64', 'float32', 'float16', 'scaled', 'delta']
+# maximum relative error of an inferred codec
+DEFAULT_RTOL = 1e-6
+# inferred float codecs : largest magnitude whose unit is kept exactly, beyond it rtol alone
+# would lose whole units (e.g. totalizers), the column stays in a wider codec
+FLOAT_EXACT = {'float16': 2 ** 11, 'float32': 2 ** 24}
+# inferred codecs : codec a column is re-encoded in when its values do not fit, see Hdf5Manager.widenColumn
+WIDER_CODECS = {'int8': {'codec': 'scaled', 'dtype': 'int16'}, 'int16': {'codec': 'scaled', 'dtype': 'int32'},
+                'int32': 'float64', 'delta': 'float64', 'float16': 'float32', 'float32': 'float64'}
+# delta codec : one absolute value is kept every DELTA_BLOCK rows, in checkpoints/<column>
+DELTA_BLOCK = 4096
+CHECKPOINTS_GROUP = 'checkpoints'
+# sparse columns : run-length extents (row start, length) of each column, in extents/<column>
+EXTENTS_GROUP = 'extents'
+EXTENTS_CHUNK = 1024
+
+
+def withinTolerance(values, decoded, rtol):
+    """
+    brief : whether decoded values are within a relative error rtol of values (no nan)
+    """
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        return bool(numpy.all(numpy.abs(decoded - values) <= rtol * numpy.abs(values)))
+
+
+def withinFloat(values, codec, rtol):
+    """
+    brief : whether values (no nan) are kept by a float codec, within rtol and below FLOAT_EXACT[codec]
+    """
+    finite = values[numpy.isfinite(values)]
+    if len(finite) > 0 and numpy.abs(finite).max() > FLOAT_EXACT.get(codec, numpy.inf):
+        return False
+    return withinTolerance(finite, finite.astype(codec).astype('float64'), rtol)
+
+
+def inferCodec(values, rtol=DEFAULT_RTOL):
+    """
+    brief : storage of a column, from the dtype and the range of its first values
+    integers : delta encoding if monotonic with a range beyond int16 or values beyond int32,
+               scaled int16 or int32 if they fit,
+    float16 and float32 : kept as is,
+    float64 : float32 if the values stay within rtol and below FLOAT_EXACT, float64 otherwise
+    returns, dict, codec spec, see normalizeCodec
+    """
+    values = numpy.asarray(values)
+    if values.dtype.kind in 'iub':
+        values = values.astype('<i8')
+        if len(values) > 1 and numpy.all(numpy.diff(values) >= 0) and (
+                values[-1] - values[0] > numpy.iinfo('int16').max or values[-1] > numpy.iinfo('int32').max):
+            return normalizeCodec('delta')
+        for dtype in ['int16', 'int32']:
+            info = numpy.iinfo(dtype)
+            if len(values) == 0 or (values.min() > info.min and values.max() <= info.max):
+                return normalizeCodec({'codec': 'scaled', 'dtype': dtype})
+        return normalizeCodec('float64')
+    if values.dtype in [numpy.float16, numpy.float32]:
+        return normalizeCodec(values.dtype.name)
+    values = values.astype('float64')
+    if withinFloat(values[~numpy.isnan(values)], 'float32', rtol):
+        return normalizeCodec('float32')
+    return normalizeCodec('float64')
+
+
+def normalizeCodec(spec):
+    """
+    brief : complete a codec spec with its defaults
+    spec, str in CODECS or dict with a 'codec' key and :
+          'scaled' : 'dtype' (int8, int16 or int32, default int16), 'scale' (default 1), 'offset' (default 0),
+                     stored value = round((value - offset) / scale)
+          'delta' : 'scale' (default 1), stored value = difference of round(value / scale) with the previous row
+    returns, dict
+    """
+    if isinstance(spec, str):
+        spec = {'codec': spec}
+    spec = dict(spec)
+    if spec.get('codec') not in CODECS:
+        raise ValueError('codec must be in {}, got {}'.format(CODECS, spec.get('codec')))
+    if spec['codec'] == 'scaled':
+        spec.setdefault('dtype', 'int16')
+        spec.setdefault('offset', 0.0)
+    if spec['codec'] in ['scaled', 'delta']:
+        spec.setdefault('scale', 1.0)
+    return spec
+
+
+def codecDtype(spec):
+    """
+    brief : dtype and fill value of the dataset of a codec, integer codecs use their min as nan
+    """
+    if spec['codec'] == 'scaled':
+        dtype = spec['dtype']
+    elif spec['codec'] == 'delta':
+        dtype = 'int32'
+    else:
+        return spec['codec'], numpy.nan
+    return dtype, numpy.iinfo(dtype).min
+
+
+def encodeValues(dataset, values, position, rtol=DEFAULT_RTOL):
+    """
+    brief : encode values to be written at position in a column dataset, following its codec
+    dataset, h5py.Dataset, with a 'codec' attribute (see Hdf5Manager.initColumns)
+    raises ValueError, when the values do not fit the codec (integer overflow, or precision
+    loss above rtol for an inferred codec)
+    """
+    codec = dataset.attrs['codec']
+    values = numpy.asarray(values, dtype='float64')
+    nan = numpy.isnan(values)
+    strict = bool(dataset.attrs.get('inferred', False))
+    if codec in ['float64', 'float32', 'float16']:
+        encoded = values.astype(codec)
+        if strict and not withinFloat(values[~nan], codec, rtol):
+            raise ValueError('column {} : values do not fit in {}, set its codec in schema'.format(dataset.name, codec))
+        return encoded
+
+    dtype, sentinel = codecDtype({'codec': codec, 'dtype': dataset.attrs.get('dtype', 'int32')})
+    info = numpy.iinfo(dtype)
+    scale = dataset.attrs['scale']
+    if codec == 'scaled':
+        offset = dataset.attrs['offset']
+        q = numpy.round((values - offset) / scale)
+        decoded = q * scale + offset
+    else:
+        # nan rows carry the previous value (the first valid one before any value), their delta is 0
+        q = numpy.round(values / scale)
+        last = dataset.attrs.get('last', None)
+        last = int(last) if last is not None else int(q[~nan][0]) if numpy.any(~nan) else 0
+        idx = numpy.maximum.accumulate(numpy.where(nan, -1, numpy.arange(len(values))))
+        absolute = numpy.where(idx >= 0, q[numpy.maximum(idx, 0)], last).astype('<i8')
+        decoded = absolute * scale
+        # the first row of each block is its checkpoint : its delta is 0, the block is seeded with it
+        q = numpy.diff(numpy.r_[last, absolute])
+        q[(position + numpy.arange(len(values))) % DELTA_BLOCK == 0] = 0
+    if numpy.any((q[~nan] <= info.min) | (q[~nan] > info.max)):
+        raise ValueError('column {} : values overflow the {} codec, set its codec in schema'.format(dataset.name, codec))
+    if strict and not withinTolerance(values[~nan], decoded[~nan], rtol):
+        raise ValueError('column {} : values do not fit in the {} codec, set its codec in schema'.format(dataset.name, codec))
+    encoded = numpy.where(nan, sentinel, q).astype(dtype)
+
+    if codec == 'delta' and len(values) > 0:
+        # checkpoint k is the absolute value of row k * DELTA_BLOCK
+        checkpoints = dataset.file[CHECKPOINTS_GROUP][dataset.name.split('/')[-1]]
+        k0 = checkpoints.shape[0]
+        k1 = (position + len(values) - 1) // DELTA_BLOCK + 1
+        if k1 > k0:
+            checkpoints.resize(k1, axis=0)
+            checkpoints[k0:k1] = absolute[numpy.arange(k0, k1) * DELTA_BLOCK - position]
+        dataset.attrs['last'] = int(absolute[-1])
+    return encoded
+
+
+def readStored(dataset, start, stop):
+    """
+    brief : read and decode the stored values [start, stop[ of a dataset, following its codec
+    """
+    codec = dataset.attrs.get('codec', None)
+    if codec not in ['scaled', 'delta']:
+        return dataset[start:stop]
+    scale = dataset.attrs['scale']
+    if codec == 'scaled':
+        raw = dataset[start:stop]
+        res = raw * scale + dataset.attrs['offset']
+    else:
+        # start from the checkpoint of the block holding start : at most DELTA_BLOCK extra values are read
+        k = start // DELTA_BLOCK
+        checkpoints = dataset.file[CHECKPOINTS_GROUP][dataset.name.split('/')[-1]]
+        raw = dataset[k * DELTA_BLOCK:stop]
+        sentinel = numpy.iinfo(raw.dtype).min
+        cumsum = numpy.cumsum(numpy.where(raw == sentinel, 0, raw).astype('<i8'))
+        block = numpy.arange(len(raw)) // DELTA_BLOCK
+        base = checkpoints[k:k + (block[-1] + 1 if len(raw) else 0)].astype('<i8')
+        absolute = base[block] + cumsum - cumsum[block * DELTA_BLOCK]
+        raw = raw[start - k * DELTA_BLOCK:]
+        res = absolute[start - k * DELTA_BLOCK:] * scale
+    res = res.astype('float64')
+    res[raw == numpy.iinfo(raw.dtype).min] = numpy.nan
+    return res
+
+
+def readColumn(dataset, start, stop):
+    """
+    brief : read rows [start, stop[ of a column dataset, dense or sparse
+    dataset, h5py.Dataset, column of Hdf5Manager
+    for a sparse column, only the stored values overlapping the rows are read (one read),
+    the other rows are nan
+    returns, numpy.ndarray
+    """
+    if 'nvalid' not in dataset.attrs:
+        return readStored(dataset, start, stop)
+    res = numpy.full(stop - start, numpy.nan, dtype='float64')
+    extents = dataset.file[EXTENTS_GROUP][dataset.name.split('/')[-1]][()]
+    if len(extents) == 0 or stop <= start:
+        return res
+    starts, lengths = extents[:, 0], extents[:, 1]
+    ends = starts + lengths
+    # position in the dataset of the first value of each extent
+    positions = numpy.r_[0, numpy.cumsum(lengths)[:-1]]
+    first = numpy.searchsorted(ends, start, side='right')
+    last = numpy.searchsorted(starts, stop, side='left')
+    if first >= last:
+        return res
+    # the stored values of consecutive extents are contiguous : one read
+    a0 = max(start, starts[first])
+    b1 = min(stop, ends[last - 1])
+    p0 = positions[first] + a0 - starts[first]
+    stored = readStored(dataset, p0, positions[last - 1] + b1 - starts[last - 1])
+    for k in range(first, last):
+        a, b = max(start, starts[k]), min(stop, ends[k])
+        p = positions[k] + a - starts[k] - p0
+        res[a - start:b - start] = stored[p:p + b - a]
+    return res
 
 
 
 class Hdf5Manager:
-    
-    
-    def __init__(self, hdf5_file_path, deleteIfExists=True):
-        
+
+
+    def __init__(self, hdf5_file_path, deleteIfExists=True, chunkSize=CHUNK_SIZE, compression=None, compressionOpts=None, shuffle=False, layout="columns", sparse=False,
+                 schema=None, rtol=DEFAULT_RTOL):
+        """
+        hdf5_file_path, str, path of the hdf5 file
+        deleteIfExists, boolean, whether to overwrite an existing file, if False, data is appended
+        chunkSize, int or None, number of rows per chunk of each dataset,
+                   if None, the datasets of data/ are contiguous once the file is closed : they are
+                   written in chunks of CHUNK_SIZE rows, and the file is rewritten without chunks on close,
+                   so that Hdf5Reader memory maps them (float codecs), no compression,
+                   appending to such a file chunks its datasets again until the next close
+        compression, None or str in COMPRESSIONS, filter applied to the datasets,
+                     blosc requires the hdf5plugin package
+        compressionOpts, None or int, compression level (gzip and blosc)
+        shuffle, boolean, whether to apply the shuffle filter before compression
+        layout, str in LAYOUTS, 'columns' : one 1-D dataset per column under data/,
+                'block' : data/TIME and one 2-D (time, sensor) float32 dataset data/VALUES,
+                the sensor names being in its 'columns' attribute, so that appending a dataframe
+                is one write and reading a window is one hyperslab read,
+                ignored when appending to an existing file (its layout is kept)
+        sparse, boolean, columns layout only, if True, each column only stores its values,
+                the rows they belong to are kept as run-length extents (row start, length)
+                in the (number of runs, 2) dataset extents/<column>, missing columns and nan gaps of at
+                least SPARSE_MIN_GAP rows cost nothing on disk, see readColumn,
+                ignored when appending to an existing file
+        schema, None or dict, column name : codec (str in CODECS or dict, see normalizeCodec),
+                columns layout only, columns not in schema get a codec inferred from their
+                first values (see inferCodec)
+        rtol, float, maximum relative error of inferred codecs, when appended values do not fit
+              the inferred codec of their column, the column is re-encoded in a wider codec
+              (see widenColumn), values which do not fit a codec of the schema raise ValueError
+        datasets are preallocated : their capacity doubles when full and they are trimmed
+        to the number of rows on close
+        """
+        if layout not in LAYOUTS:
+            raise ValueError('layout must be in {}, got {}'.format(LAYOUTS, layout))
+        self.layout = layout
+        if sparse and layout != 'columns':
+            raise ValueError('sparse is only available for the columns layout')
+        self.sparse = sparse
+        self.schema = {} if schema is None else {c: normalizeCodec(v) for c, v in schema.items()}
+        self.rtol = rtol
+
         self.offset = 0
         self.listcols = []
+        self.contiguous = chunkSize is None
+        if self.contiguous and compression is not None:
+            raise ValueError('compression needs chunks, chunkSize=None is only available without compression')
+        self.chunkSize = CHUNK_SIZE if chunkSize is None else chunkSize
+        self.filterOpts = self.getFilterOpts(compression, compressionOpts, shuffle)
         mode = "w"
         # initialize file if file does not exist
         if os.path.exists(hdf5_file_path):
@@ -24,82 +299,388 @@ class Hdf5Manager:
                 print('deleteIfExists=True : will delete the file')
                 mode = "w"
             elif os.path.isdir(hdf5_file_path):
-                raise ValueError('expected {} to be  a file, not a folder'.folder(hdf5_file_path))
+                raise ValueError('expected {} to be  a file, not a folder'.format(hdf5_file_path))
             else:
                 # check it is indeed an hdf5 file
                 pass
-        
+
         self.h5file = h5py.File(hdf5_file_path, mode)
         if 'data' not in self.h5file.keys():
             self.h5columns = self.h5file.create_group('data')
-        
+            self.h5columns.attrs['sparse'] = self.sparse
+            self.capacity = 0
+
         else:
             self.h5columns = self.h5file['data']
-    
+            if BLOCK_DATASET in self.h5columns.keys():
+                self.layout = 'block'
+                self.listcols = ['TIME'] + list(self.h5columns[BLOCK_DATASET].attrs['columns'])
+            else:
+                self.layout = 'columns'
+                self.listcols = list(self.h5columns.keys())
+            self.sparse = bool(self.h5columns.attrs.get('sparse', False))
+            self.capacity = self.h5columns['TIME'].shape[0] if 'TIME' in self.h5columns.keys() else 0
+            self.offset = int(self.h5columns.attrs.get('nrows', self.capacity))
+
+    @staticmethod
+    def getFilterOpts(compression, compressionOpts, shuffle):
+        """
+        brief : keyword arguments of create_dataset for the compression filter
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError('compression must be in {}, got {}'.format(COMPRESSIONS, compression))
+        if compression is None:
+            return {}
+        if compression == 'blosc':
+            if hdf5plugin is None:
+                raise ImportError('compression="blosc" requires the hdf5plugin package')
+            clevel = 5 if compressionOpts is None else compressionOpts
+            shuffleOpt = hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE
+            return dict(hdf5plugin.Blosc(cname='lz4', clevel=clevel, shuffle=shuffleOpt))
+        opts = {'compression': compression, 'shuffle': shuffle}
+        if compression == 'gzip' and compressionOpts is not None:
+            opts['compression_opts'] = compressionOpts
+        return opts
+
     def addFromDataframe(self, df):
         """
-        brief: 
+        brief: append the rows of a dataframe to the datasets
+        df, pandas.DataFrame, TIME column in datetime64[ns], other columns numeric
+        columns not yet in the file are created, rows of columns absent from df are
+        not written and read as nan (fill value of the datasets)
+        rows are sorted on TIME and must not be older than the rows already in the file,
+        so that the TIME dataset stays sorted, see Hdf5Reader
         """
+        df = self.sortedRows(df)
+        self.rechunk()
+        if self.layout == 'block':
+            self.addBlockFromDataframe(df)
+            return
         if len(self.h5columns.keys()) == 0:
-            self.initColumns(df.columns)
-        
+            self.initColumns(df.columns, df)
+
+        n = len(df)
+        self.reserve(self.offset + n)
         for col in df.columns:
             if col not in self.h5columns.keys():
                 print("------------------------------------------------")
                 print('col : ', col)
-                self.initColumns([col])
-                #self.h5columns[c].resize(self.offset, axis=0)
-                hc = self.h5columns[col]
-                hc.resize(self.offset, axis=0)
-                hc[0:] = numpy.full(self.offset, numpy.nan)
+                # the first self.offset rows are read as nan, without being written
+                self.initColumns([col], df)
 
             col_dataset = self.h5columns[col]
-            sz0 = col_dataset.shape[0]
-            col_dataset.resize(sz0 + len(df), axis=0)
-            if col == 'TIME':
-                col_dataset[sz0:] = df[col].to_numpy().view('<i8')
+            if self.sparse and col != 'TIME':
+                self.appendSparse(col, df[col].to_numpy())
+            elif col == 'TIME':
+                col_dataset[self.offset:self.offset + n] = df[col].to_numpy(dtype='datetime64[ns]').view('<i8')
             else:
-                col_dataset[sz0:] = df[col].to_numpy()
-                
-        col_not_updated = [c for c in self.listcols if c not in df.columns]
-        for c in col_not_updated:
-            print('col left : ', c)
-            hc = self.h5columns[c]
-            sz = hc.shape[0]
-            hc.resize(sz + len(df), axis=0)
-            hc[sz:] = numpy.full(len(df), numpy.nan)
-        #cols_left = [c for c in self.listcols if c not in col]
-
-        
-        self.offset = self.offset + len(df)
+                self.writeEncoded(col, df[col].to_numpy(), self.offset)
+
+        self.offset = self.offset + n
+        self.h5columns.attrs['nrows'] = self.offset
+        print('self.offset is : ', self.offset)
+
+    def sortedRows(self, df):
+        """
+        brief : df sorted on TIME
+        raises ValueError, if df has rows older than the last row of the file
+        """
+        if not df['TIME'].is_monotonic_increasing:
+            df = df.sort_values('TIME', kind='mergesort')
+        if self.offset > 0 and len(df) > 0:
+            lastTime = self.h5columns['TIME'][self.offset - 1]
+            if df['TIME'].iloc[0].value < lastTime:
+                raise ValueError('rows older than the last row of the file cannot be appended, TIME must stay sorted')
+        return df
+
+    def addBlockFromDataframe(self, df):
+        """
+        brief : append the rows of a dataframe in the block layout, with one write of
+                all the sensors, columns absent from df are nan
+        """
+        if len(self.h5columns.keys()) == 0:
+            self.initBlock()
+        newcols = [c for c in df.columns if c not in self.listcols]
+        if newcols:
+            print('new cols : ', newcols)
+            self.listcols += newcols
+            block = self.h5columns[BLOCK_DATASET]
+            block.resize(len(self.listcols) - 1, axis=1)
+            block.attrs['columns'] = numpy.array(self.listcols[1:], dtype=h5py.string_dtype())
+
+        n = len(df)
+        self.reserve(self.offset + n)
+        positions = {c: i for i, c in enumerate(self.listcols[1:])}
+        values = numpy.full((n, len(positions)), numpy.nan, dtype='float32')
+        for col in df.columns:
+            if col != 'TIME':
+                values[:, positions[col]] = df[col].to_numpy()
+        self.h5columns['TIME'][self.offset:self.offset + n] = df['TIME'].to_numpy(dtype='datetime64[ns]').view('<i8')
+        self.h5columns[BLOCK_DATASET][self.offset:self.offset + n, :] = values
+
+        self.offset = self.offset + n
+        self.h5columns.attrs['nrows'] = self.offset
         print('self.offset is : ', self.offset)
-        
-    
-    
-    def initColumns(self, cols):
+
+    def initBlock(self):
+        """
+        brief : init the TIME and VALUES datasets of the block layout, without sensors
+        VALUES is chunked along time, BLOCK_CHUNK_COLS sensors per chunk
+        """
+        self.listcols = ['TIME']
+        self.h5columns.create_dataset('TIME', (self.capacity,), dtype='<i8', maxshape=(None,),
+                                      chunks=(self.chunkSize,), fillvalue=0, **self.filterOpts)
+        chunkRows = max(1, self.chunkSize // BLOCK_CHUNK_COLS)
+        block = self.h5columns.create_dataset(BLOCK_DATASET, (self.capacity, 0), dtype='float32', maxshape=(None, None),
+                                              chunks=(chunkRows, BLOCK_CHUNK_COLS), fillvalue=numpy.nan, **self.filterOpts)
+        block.attrs['columns'] = numpy.array([], dtype=h5py.string_dtype())
+
+    def appendSparse(self, col, values):
+        """
+        brief : append the rows of a sparse column, rows starting at self.offset
+        only the runs of values (nan gaps shorter than SPARSE_MIN_GAP included) are written,
+        their extents are merged with the last extent of the column when contiguous
+        """
+        values = numpy.asarray(values, dtype='float64')
+        runs = self.validRuns(~numpy.isnan(values))
+        if len(runs) == 0:
+            return
+        stored = numpy.concatenate([values[r0:r0 + n] for r0, n in runs])
+        col_dataset = self.h5columns[col]
+        nvalid = int(col_dataset.attrs['nvalid'])
+        if nvalid + len(stored) > col_dataset.shape[0]:
+            col_dataset.resize(max(nvalid + len(stored), 2 * col_dataset.shape[0], self.chunkSize), axis=0)
+        self.writeEncoded(col, stored, nvalid)
+
+        runs[:, 0] += self.offset
+        extents = self.h5file[EXTENTS_GROUP][col]
+        k = extents.shape[0]
+        if k > 0:
+            lastStart, lastLength = extents[k - 1]
+            if lastStart + lastLength == runs[0, 0]:
+                extents[k - 1, 1] = lastLength + runs[0, 1]
+                runs = runs[1:]
+        if len(runs) > 0:
+            extents.resize(k + len(runs), axis=0)
+            extents[k:k + len(runs)] = runs
+        self.h5columns[col].attrs['nvalid'] = nvalid + len(stored)
+
+    @staticmethod
+    def validRuns(valid, minGap=SPARSE_MIN_GAP):
+        """
+        brief : runs of valid rows, gaps shorter than minGap rows do not split a run
+        valid, numpy.ndarray of bool
+        returns, numpy.ndarray of shape (number of runs, 2), (row start, length) of each run
+        """
+        idx = numpy.flatnonzero(valid)
+        if len(idx) == 0:
+            return numpy.empty((0, 2), dtype='<i8')
+        breaks = numpy.flatnonzero(numpy.diff(idx) > minGap)
+        starts = idx[numpy.r_[0, breaks + 1]]
+        ends = idx[numpy.r_[breaks, len(idx) - 1]] + 1
+        return numpy.stack([starts, ends - starts], axis=1).astype('<i8')
+
+    def readColumn(self, col, start=0, stop=None):
+        """
+        brief : read rows [start, stop[ of a column, whatever the layout, absent rows are nan
+        """
+        if stop is None:
+            stop = self.offset
+        if self.layout == 'block' and col != 'TIME':
+            return self.h5columns[BLOCK_DATASET][start:stop, self.listcols.index(col) - 1]
+        return readColumn(self.h5columns[col], start, stop)
+
+    def rechunk(self):
+        """
+        brief : chunk again the contiguous datasets of a file closed with chunkSize=None,
+                so that they can grow
+        """
+        for name in list(self.h5columns.keys()):
+            ds = self.h5columns[name]
+            if ds.chunks is not None:
+                continue
+            self.h5columns.move(name, name + '.contiguous')
+            old = self.h5columns[name + '.contiguous']
+            chunks = (self.chunkSize,) if old.ndim == 1 else (max(1, self.chunkSize // BLOCK_CHUNK_COLS), BLOCK_CHUNK_COLS)
+            new = self.h5columns.create_dataset(name, old.shape, dtype=old.dtype, maxshape=(None,) * old.ndim,
+                                                chunks=chunks, fillvalue=old.fillvalue, **self.filterOpts)
+            self.copyDataset(old, new)
+            del self.h5columns[name + '.contiguous']
+
+    def copyDataset(self, source, target):
+        """
+        brief : copy the values and the attributes of a dataset, chunkSize rows at a time
+        """
+        for start in range(0, source.shape[0], self.chunkSize):
+            target[start:start + self.chunkSize] = source[start:start + self.chunkSize]
+        for key, value in source.attrs.items():
+            target.attrs[key] = value
+
+    def writeContiguous(self):
+        """
+        brief : rewrite the file with contiguous datasets under data/, the other groups are copied as is,
+                the new file replaces the old one once written
+        """
+        path = self.h5file.filename
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.h5')
+        os.close(fd)
+        try:
+            with h5py.File(tmpPath, 'w') as out:
+                for name in self.h5file.keys():
+                    if name != 'data':
+                        self.h5file.copy(self.h5file[name], out, name=name)
+                data = out.create_group('data')
+                for key, value in self.h5columns.attrs.items():
+                    data.attrs[key] = value
+                for name in self.h5columns.keys():
+                    ds = self.h5columns[name]
+                    self.copyDataset(ds, data.create_dataset(name, ds.shape, dtype=ds.dtype, fillvalue=ds.fillvalue))
+            self.h5file.close()
+            os.replace(tmpPath, path)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def writeEncoded(self, col, values, position):
+        """
+        brief : encode values and write them at position in the dataset of col,
+                an inferred codec too narrow for the values is widened first, see widenColumn
+        raises ValueError, when the values do not fit the codec of col in the schema
+        """
+        while True:
+            ds = self.h5columns[col]
+            try:
+                encoded = encodeValues(ds, values, position, self.rtol)
+                break
+            except ValueError:
+                if not ds.attrs.get('inferred', False) or ds.attrs['codec'] == 'float64':
+                    raise
+                self.widenColumn(col)
+        ds[position:position + len(values)] = encoded
+
+    def widenColumn(self, col):
+        """
+        brief : re-encode the stored values of a column with an inferred codec in the next wider codec,
+                scaled int16 -> scaled int32 -> float64, delta -> float64, float16 -> float32 -> float64
+        """
+        old = self.h5columns[col]
+        codec = old.attrs['codec']
+        spec = normalizeCodec(WIDER_CODECS[old.attrs['dtype'] if codec == 'scaled' else codec])
+        if spec['codec'] == 'scaled':
+            spec['scale'], spec['offset'] = old.attrs['scale'], old.attrs['offset']
+        print('column {} : values do not fit in the {} codec, re-encoded in {}'.format(col, codec, spec.get('dtype', spec['codec'])))
+        stored = int(old.attrs.get('nvalid', self.offset))
+        if codec == 'delta':
+            # decoding a delta column reads its checkpoints, which are dropped with the codec
+            values = readStored(old, 0, stored)
+            del self.h5file[CHECKPOINTS_GROUP][col]
+        self.h5columns.move(col, col + '.narrow')
+        old = self.h5columns[col + '.narrow']
+        new = self.createColumn(col, dict(spec, inferred=True), old.shape[0])
+        if 'nvalid' in old.attrs:
+            new.attrs['nvalid'] = old.attrs['nvalid']
+        for start in range(0, stored, self.chunkSize):
+            stop = min(stored, start + self.chunkSize)
+            chunk = values[start:stop] if codec == 'delta' else readStored(old, start, stop)
+            new[start:stop] = encodeValues(new, chunk, start, self.rtol)
+        del self.h5columns[col + '.narrow']
+
+    def reserve(self, size):
+        """
+        brief : make sure the datasets can hold size rows, capacity grows geometrically
+        sparse columns grow on their own, see appendSparse
+        """
+        if size <= self.capacity:
+            return
+        capacity = max(size, 2 * self.capacity, self.chunkSize)
+        for name in self.h5columns.keys():
+            if 'nvalid' not in self.h5columns[name].attrs:
+                self.h5columns[name].resize(capacity, axis=0)
+        self.capacity = capacity
+
+
+    def initColumns(self, cols, df=None):
         """
         brief : init datagroup's datasets
         cols, list[str], name of the columns,
-                all columns except TIME are in float32
+                TIME is in int64, the storage of the other columns is given by
+                the schema, or inferred from their values in df (float32 without df)
+        df, pandas.DataFrame or None, first rows of the columns
+        datasets are chunked along the rows, preallocated to the current capacity, and filled with nan
         """
-        
+
         self.listcols += list(cols)
         for col in cols:
             if col == 'TIME':
-                dtp = '<i8'
+                spec = None
             else:
-                dtp = 'float16'
-            self.h5columns.create_dataset(col, (0,), dtype=dtp, maxshape=(None,))
+                if col in self.schema:
+                    spec = self.schema[col]
+                elif df is not None:
+                    spec = dict(inferCodec(df[col].to_numpy(), self.rtol), inferred=True)
+                else:
+                    spec = normalizeCodec('float32')
+            # sparse columns only hold their values, see appendSparse
+            size = 0 if self.sparse and col != 'TIME' else self.capacity
+            ds = self.createColumn(col, spec, size)
+            if self.sparse and col != 'TIME':
+                ds.attrs['nvalid'] = 0
+                extents = self.h5file.require_group(EXTENTS_GROUP)
+                extents.create_dataset(col, (0, 2), dtype='<i8', maxshape=(None, 2), chunks=(EXTENTS_CHUNK, 2))
 
         return
 
-    
-            
-    def __del__(self):
-        if hasattr(self, 'h5file'):
+    def createColumn(self, col, spec, size):
+        """
+        brief : create the chunked dataset of a column, with its codec spec in its attributes
+        spec, dict or None, codec spec, None for TIME (int64)
+        returns, h5py.Dataset
+        """
+        if spec is None:
+            dtp, fill = '<i8', 0
+        else:
+            dtp, fill = codecDtype(spec)
+        ds = self.h5columns.create_dataset(col, (size,), dtype=dtp, maxshape=(None,),
+                                           chunks=(self.chunkSize,), fillvalue=fill, **self.filterOpts)
+        if spec is not None:
+            for key, value in spec.items():
+                ds.attrs[key] = value
+            if spec['codec'] == 'delta':
+                checkpoints = self.h5file.require_group(CHECKPOINTS_GROUP)
+                checkpoints.create_dataset(col, (0,), dtype='<i8', maxshape=(None,), chunks=(1024,))
+        return ds
+
+    def close(self):
+        """
+        brief : trim the datasets to the number of rows and close the file
+        to be called explicitly, or use the manager as a context manager :
+            with Hdf5Manager(path) as manager:
+                manager.addFromDataframe(df)
+        """
+        if not self.h5file:
+            return
+        for name in self.h5columns.keys():
+            ds = self.h5columns[name]
+            ds.resize(int(ds.attrs.get('nvalid', self.offset)), axis=0)
+        self.capacity = self.offset
+        self.h5columns.attrs['nrows'] = self.offset
+        if self.contiguous:
+            self.writeContiguous()
+        else:
             self.h5file.close()
-        
-            
-            
-                
-                
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __del__(self):
+        # no trimming here, h5py may already be torn down at interpreter shutdown,
+        # an untrimmed file stays readable, the 'nrows' attribute is kept up to date
+        h5file = getattr(self, 'h5file', None)
+        try:
+            if h5file:
+                h5file.close()
+        except Exception:
+            pass
@@ -0,0 +1,164 @@
+
+
+import h5py
+
+import numpy
+import pandas as pd
+from datetime import datetime
+
+from hdf5_manager import BLOCK_DATASET, readColumn
+
+
+# timeType="timestamps" : timestamps are in ms, TIME is stored in ns
+TIMESTAMP_MULT = 10**6
+
+
+class Hdf5Reader:
+    """
+    reader of the files written by Hdf5Manager (columns, block or sparse layout)
+    windows are found by binary search on the sorted TIME dataset, and only the
+    matching rows of the requested columns are read
+    """
+
+    def __init__(self, hdf5_file_path, indexStep=None, mmap=True):
+        """
+        hdf5_file_path, str, path of the hdf5 file
+        indexStep, int or None, if None, TIME is loaded in memory (8 bytes per row),
+                   otherwise only one timestamp every indexStep rows is kept in memory,
+                   and a window costs two reads of at most indexStep timestamps
+        mmap, boolean, whether to memory map the contiguous uncompressed datasets (files written
+              by Hdf5Manager with chunkSize=None, float codecs), rows of these datasets are then
+              returned as zero copy numpy views, chunked datasets are read through h5py
+        """
+        self.hdf5_file_path = hdf5_file_path
+        self.h5file = h5py.File(hdf5_file_path, 'r')
+        self.h5columns = self.h5file['data']
+        timeDataset = self.h5columns['TIME']
+        self.nrows = int(self.h5columns.attrs.get('nrows', timeDataset.shape[0]))
+
+        if BLOCK_DATASET in self.h5columns.keys():
+            self.layout = 'block'
+            self.listcols = ['TIME'] + list(self.h5columns[BLOCK_DATASET].attrs['columns'])
+        else:
+            self.layout = 'columns'
+            self.listcols = list(self.h5columns.keys())
+
+        self.mmaps = {}
+        if mmap:
+            for name in self.h5columns.keys():
+                ds = self.h5columns[name]
+                # integer codecs need decoding, see readStored, sparse columns only hold their values
+                rawFloat = ds.attrs.get('codec', None) in [None, 'float64', 'float32', 'float16'] and 'nvalid' not in ds.attrs
+                if rawFloat and ds.chunks is None and ds.compression is None and ds.id.get_offset() is not None:
+                    self.mmaps[name] = numpy.memmap(hdf5_file_path, dtype=ds.dtype, mode='r',
+                                                    offset=ds.id.get_offset(), shape=ds.shape)
+
+        self.indexStep = indexStep
+        if indexStep is None:
+            self.times = self.readRows('TIME', 0, self.nrows)
+            self.sparseIndex = None
+        else:
+            self.times = None
+            self.sparseIndex = timeDataset[0:self.nrows:indexStep]
+
+    def readRows(self, name, start, stop):
+        """
+        brief : rows [start, stop[ of a dataset, a view of the memory map when there is one
+        """
+        if name in self.mmaps:
+            return self.mmaps[name][start:stop]
+        return self.h5columns[name][start:stop]
+
+    def searchTime(self, t, side='left'):
+        """
+        brief : position of t in the sorted TIME dataset, as numpy.searchsorted
+        t, int, time in ns
+        """
+        if self.sparseIndex is None:
+            return int(numpy.searchsorted(self.times, t, side=side))
+        k = int(numpy.searchsorted(self.sparseIndex, t, side=side))
+        lo = max(0, (k - 1) * self.indexStep)
+        hi = min(self.nrows, k * self.indexStep)
+        return lo + int(numpy.searchsorted(self.readRows('TIME', lo, hi), t, side=side))
+
+    @staticmethod
+    def toTimeInt(date, timeType="datetime"):
+        """
+        brief : convert a date to ns, None or nan means no bound
+        date, datetime.datetime, numpy.datetime64 or str (timeType="datetime"),
+              or timestamp in ms (timeType="timestamps")
+        """
+        if date is None or (isinstance(date, float) and numpy.isnan(date)):
+            return None
+        if timeType == "timestamps":
+            return int(date * TIMESTAMP_MULT)
+        elif timeType == "datetime":
+            if isinstance(date, str):
+                date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+            return int(numpy.datetime64(date, 'ns').astype('<i8'))
+        else:
+            raise ValueError('timeType must be "datetime" or "timestamps", got {}'.format(timeType))
+
+    def timeSlice(self, start, end, timeType="datetime"):
+        """
+        brief : positions of the rows within [start, end]
+        returns, (int, int), start and stop positions
+        """
+        t0 = self.toTimeInt(start, timeType)
+        t1 = self.toTimeInt(end, timeType)
+        i0 = 0 if t0 is None else self.searchTime(t0, side='left')
+        i1 = self.nrows if t1 is None else self.searchTime(t1, side='right')
+        return i0, max(i0, i1)
+
+    def timeQueryArrays(self, start, end, cols=None, timeType="datetime"):
+        """
+        brief : rows within [start, end] of the requested columns, as numpy arrays
+        cols, None or list[str], columns to read, if None, all columns
+        returns, dict, column name : numpy.ndarray, TIME in datetime64[ns]
+        """
+        if cols is None:
+            cols = [c for c in self.listcols if c != 'TIME']
+        else:
+            cols = [c for c in cols if c != 'TIME']
+        i0, i1 = self.timeSlice(start, end, timeType)
+
+        if self.times is not None:
+            times = self.times[i0:i1]
+        else:
+            times = self.readRows('TIME', i0, i1)
+        res = {'TIME': times.view('datetime64[ns]')}
+
+        if self.layout == 'block':
+            if cols:
+                # one hyperslab read, h5py needs increasing indexes
+                positions = sorted(set(self.listcols.index(c) - 1 for c in cols))
+                block = self.h5columns[BLOCK_DATASET][i0:i1, positions]
+                for c in cols:
+                    res[c] = block[:, positions.index(self.listcols.index(c) - 1)]
+            return res
+
+        for c in cols:
+            if c in self.mmaps:
+                res[c] = self.mmaps[c][i0:i1]
+            else:
+                res[c] = readColumn(self.h5columns[c], i0, i1)
+        return res
+
+    def timeQuery(self, start, end, cols=None, timeType="datetime"):
+        """
+        brief : rows within [start, end] of the requested columns
+        start, end, datetime.datetime or str of the form yyyy-mm-dd --:--:-- (timeType="datetime"),
+                    or timestamps in ms (timeType="timestamps"), None or nan for no bound
+        cols, None or list[str], columns to read, if None, all columns
+        returns, pandas.DataFrame
+        """
+        return pd.DataFrame(self.timeQueryArrays(start, end, cols=cols, timeType=timeType))
+
+    def close(self):
+        self.mmaps = {}
+        if self.h5file:
+            self.h5file.close()
+
+    def __del__(self):
+        if hasattr(self, 'h5file'):
+            self.close()
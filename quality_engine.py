@@ -1,23 +1,497 @@
 
 import logging
 import os
+import io
+import re
 from glob import glob
 import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import codecs
 import pickle
 import shutil
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    from pyarrow import compute as pc
+    from pyarrow import dataset as ds
+    from pyarrow import parquet as pq
+except ImportError:
+    pa = None
+    pa_csv = None
+    pc = None
+    ds = None
+    pq = None
 
 #from safir_engine.hdf5_manager_quality import Hdf5ManagerQuality
 #from safir_engine.hdf5_reader_quality import Hdf5ReaderQuality
 
+
+# moteurs de parsing des exports, "python" : lecture historique, "c"/"pyarrow" : voir SapLineFilter
+PARSERS = ["python", "c", "pyarrow"]
+# une colonne texte devient category si nb valeurs distinctes <= CATEGORY_RATIO * nb lignes
+CATEGORY_RATIO = 0.5
+NUMERIC_RE = r'[+-]?\d+(?:[.,]\d+)?'
+# les identifiants SAP (lots, articles) sont paddés par des zéros, ils restent du texte
+LEADING_ZERO_RE = r'[+-]?0\d'
+DATE_RE = r'\d{2}\.\d{2}\.\d{4}'
+DATE_FORMAT = '%d.%m.%Y'
+# store parquet : un dossier par export dans le dossier de sortie, et le manifeste des exports traités
+MANIFEST_FILE = 'manifest.json'
+PART_NAME = 'part-{:05d}.parquet'
+HASH_BLOCK = 1 << 20
+# nombre de lignes par chunk du mode streaming, voir iter_quality_chunks
+CHUNK_ROWS = 100000
+# nombre de valeurs sur lesquelles le type d'une colonne est deviné, voir infer_quality_dtypes
+INFER_SAMPLE = 1000
+
+
+class SapLineFilter:
+    """
+    @brief: fichier texte filtré d'un export SAP, seules les lignes de la table sont gardées
+            (celles qui commencent par '|', hors lignes de séparation '|---' et entêtes répétées
+            par les sauts de page). Avec trim, les blancs avant les '|' sont supprimés, ceux
+            après sont laissés au skipinitialspace du moteur C. Le nettoyage est fait par regex
+            sur des blocs de lignes, pas ligne par ligne
+    """
+    DROP_LINES = re.compile(r'^(?:[^|\n].*|\|-.*|)(?:\n|$)', re.M)
+    TRAILING_SPACES = re.compile(r' +\|')
+
+    def __init__(self, file, encoding="latin-1", trim=True):
+        self.fd = open(file, 'r', encoding=encoding)
+        self.trim = trim
+        self.header = None
+
+    def cleanLines(self, lines):
+        text = self.DROP_LINES.sub('', ''.join(lines))
+        if not text:
+            return ''
+        if self.trim:
+            text = self.TRAILING_SPACES.sub('|', text)
+        if not text.endswith('\n'):
+            text += '\n'
+        if self.header is None:
+            self.header, _, text = text.partition('\n')
+            return self.header + '\n' + ('\n' + text).replace('\n' + self.header + '\n', '\n')[1:]
+        return ('\n' + text).replace('\n' + self.header + '\n', '\n')[1:]
+
+    def edgeColumns(self, columns):
+        """
+        @brief: colonnes vides créées par les '|' de début et de fin de ligne
+        """
+        if self.header is not None and self.header.rstrip().endswith('|'):
+            return [columns[0], columns[-1]]
+        return [columns[0]]
+
+    def read(self, size=-1):
+        text = ''
+        # un bloc peut être entièrement filtré, on lit jusqu'à avoir du contenu ou la fin du fichier
+        while not text:
+            lines = self.fd.readlines(size if size and size > 0 else -1)
+            if not lines:
+                return ''
+            text = self.cleanLines(lines)
+        return text
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def readline(self):
+        return self.read(1)
+
+    def close(self):
+        self.fd.close()
+
+
+def infer_quality_dtypes(df, kinds=None):
+    """
+    @brief: typage des colonnes texte d'un export, en place : numérique si toutes les valeurs non
+            vides sont des nombres sans zéro de tête (float64), datetime si toutes sont des dates
+            jj.mm.aaaa, category si peu de valeurs distinctes, texte sinon. Le motif est testé sur
+            les INFER_SAMPLE premières valeurs puis la conversion complète est vérifiée (aucune
+            valeur non vide perdue), sinon la colonne reste du texte
+    df, pandas.DataFrame, colonnes str, '' pour les valeurs vides
+    kinds, dict or None, colonne : type retenu ('num', 'num,' pour les décimales à virgule, 'date',
+            'text'), les colonnes déjà présentes sont converties selon ce type, les autres sont
+            devinées et ajoutées ; permet de garder le même typage sur tous les chunks d'un export.
+            Si des valeurs d'un chunk ne sont pas convertibles, la colonne passe en 'text' dans kinds,
+            les chunks déjà rendus sont à remettre en texte (voir write_quality_parts)
+    return, pandas.DataFrame, avec le typage retenu dans df.attrs['kinds'], voir quality_kinds
+    """
+    if kinds is None:
+        kinds = {}
+    for c in df.columns:
+        col = df[c]
+        if col.dtype != object:
+            continue
+        empty = (col == '').to_numpy()
+        n_empty = empty.sum()
+        kind = kinds.get(c)
+        if kind is None:
+            sample = col[~empty][:INFER_SAMPLE]
+            if len(sample) == 0:
+                continue
+            kind = 'text'
+            if sample.str.fullmatch(NUMERIC_RE).all() and not sample.str.match(LEADING_ZERO_RE).any():
+                kind = 'num,' if sample.str.contains(',', regex=False).any() else 'num'
+            elif sample.str.fullmatch(DATE_RE).all():
+                kind = 'date'
+
+        # float64 même pour des entiers, tous les chunks d'un export ont le même schéma
+        if kind == 'num,':
+            conv = pd.to_numeric(col.str.replace(',', '.', regex=False), errors='coerce').astype('float64')
+        elif kind == 'num':
+            conv = pd.to_numeric(col, errors='coerce').astype('float64')
+        elif kind == 'date':
+            conv = pd.to_datetime(col, format=DATE_FORMAT, errors='coerce')
+        else:
+            conv = None
+        if conv is not None:
+            lost = conv.isna().sum() - n_empty
+            if lost == 0:
+                df[c] = conv
+                kinds[c] = kind
+                continue
+            if c in kinds:
+                print('WARNING : colonne {}, {} valeurs non convertibles en {}, la colonne passe en texte'.format(c, lost, kind))
+            kind = 'text'
+        kinds[c] = kind
+        if col.nunique() <= CATEGORY_RATIO * len(col):
+            df[c] = col.astype('category')
+    df.attrs['kinds'] = dict(kinds)
+    return df
+
+
+def quality_kinds(df):
+    """
+    @brief: typage des colonnes d'un export parsé, celui de infer_quality_dtypes s'il est connu,
+            sinon déduit des dtypes ('num', 'date' ou 'text'), None pour une colonne texte vide
+    df, pandas.DataFrame
+    return, dict, colonne : type
+    """
+    known = df.attrs.get('kinds', {})
+    kinds = {}
+    for c in df.columns:
+        col = df[c]
+        if c in known:
+            kinds[c] = known[c]
+        elif pd.api.types.is_datetime64_any_dtype(col.dtype):
+            kinds[c] = 'date'
+        elif pd.api.types.is_numeric_dtype(col.dtype):
+            kinds[c] = 'num'
+        elif col.dtype == object and (col == '').all():
+            kinds[c] = None
+        else:
+            kinds[c] = 'text'
+    return kinds
+
+
+def merge_quality_kinds(kindsList):
+    """
+    @brief: typage commun de plusieurs exports (ou parties), une colonne de types différents passe en
+            texte, sauf 'num' et 'num,' qui sont tous deux en float64 ; une colonne vide (None) prend
+            le type des autres
+    kindsList, iterable of dict, colonne : type, voir quality_kinds
+    return, dict, colonne : type
+    """
+    target = {}
+    for kinds in kindsList:
+        for c, kind in kinds.items():
+            if kind is None:
+                target.setdefault(c, None)
+            elif target.get(c) is None:
+                target[c] = kind
+            elif target[c] != kind:
+                target[c] = 'num' if {target[c], kind} <= {'num', 'num,'} else 'text'
+    return target
+
+
+def same_quality_kind(kind, goal):
+    """
+    @brief: si une colonne de type kind est déjà stockée comme le type commun goal (None : vide)
+    """
+    return goal is None or kind == goal or {kind, goal} <= {'num', 'num,'} or (goal == 'text' and kind is None)
+
+
+def convert_quality_kinds(df, kinds, target):
+    """
+    @brief: colonnes de df converties de leur typage vers le typage commun, les colonnes typées qui
+            passent en texte sont formatées par format_quality_text, les colonnes vides prennent le type
+            commun
+    df, pandas.DataFrame
+    kinds, dict, typage de df, une colonne absente ou à None est vide
+    target, dict, typage commun, voir merge_quality_kinds
+    return, pandas.DataFrame, df si rien n'est à convertir, une copie sinon
+    """
+    copied = False
+    for c in df.columns:
+        kind, goal = kinds.get(c), target.get(c)
+        if same_quality_kind(kind, goal):
+            continue
+        if not copied:
+            df = df.copy(deep=False)
+            copied = True
+        if goal == 'text':
+            df[c] = format_quality_text(df[c], kind)
+        elif goal == 'date':
+            df[c] = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        else:
+            df[c] = np.nan
+    return df
+
+
+def concat_quality_frames(dfs):
+    """
+    @brief: concaténation des exports parsés séparément ; le typage de chaque colonne est décidé sur
+            tous les exports (une colonne numérique dans un export et texte dans un autre est remise en
+            texte partout, voir format_quality_text) et les colonnes category dans tous les exports
+            restent category (union des catégories) au lieu de repasser en object
+    dfs, list of pandas.DataFrame, exports parsés
+    return, pandas.DataFrame
+    """
+    if not dfs:
+        return pd.DataFrame()
+    frameKinds = [quality_kinds(df) for df in dfs]
+    target = merge_quality_kinds(frameKinds)
+    frames = [convert_quality_kinds(df, kinds, target) for df, kinds in zip(dfs, frameKinds)]
+
+    order = list(dict.fromkeys(c for df in frames for c in df.columns))
+    cats = [c for c in order if all(isinstance(df[c].dtype, pd.CategoricalDtype) for df in frames if c in df.columns)]
+    res = pd.concat([df.drop(columns=[c for c in cats if c in df.columns]) for df in frames])
+    for c in cats:
+        res[c] = union_categoricals([df[c] if c in df.columns else pd.Categorical([None] * len(df)) for df in frames])
+    return res[order]
+
+
+def parse_quality_file(file, parser="python"):
+    """
+    @brief: parse un export SAP qualité (format '|'), colonnes et valeurs nettoyées
+    file, str, chemin du fichier .txt
+    parser, str in PARSERS, "python" : lecture historique, toutes les colonnes en str,
+            "c" ou "pyarrow" : lignes filtrées par SapLineFilter et colonnes typées par
+            infer_quality_dtypes
+    return, pandas.DataFrame
+    """
+    print('file : ', file)
+    if parser == "python":
+        df = pd.read_csv(file, sep='|', header=3, encoding="latin-1", engine="python", quoting=3)
+        cols = [c.strip() for c in df.columns]
+        df.columns = cols
+        for c in cols:
+            df[c] = df[c].astype(str).str.strip()
+        return df
+    if parser not in PARSERS:
+        raise ValueError("parser doit être dans {}".format(PARSERS))
+
+    lines = SapLineFilter(file, trim=parser != "pyarrow")
+    try:
+        if parser == "pyarrow":
+            if pa_csv is None:
+                raise ImportError("le parser pyarrow nécessite le package pyarrow")
+            # pyarrow lit des octets, le texte filtré est ré-encodé en une fois ; les colonnes sont
+            # lues en texte pour garder les zéros de tête, le typage est fait par infer_quality_dtypes
+            data = io.BytesIO(lines.read().encode('utf-8'))
+            names = lines.header.split('|') if lines.header is not None else []
+            table = pa_csv.read_csv(data,
+                                    parse_options=pa_csv.ParseOptions(delimiter='|', quote_char=False),
+                                    convert_options=pa_csv.ConvertOptions(
+                                        column_types={n: pa.string() for n in names},
+                                        strings_can_be_null=False))
+            edges = lines.edgeColumns(list(range(table.num_columns)))
+            df = pd.DataFrame({table.column_names[i].strip(): pc.utf8_trim_whitespace(table.column(i)).to_pandas()
+                               for i in range(table.num_columns) if i not in edges})
+        else:
+            df = pd.read_csv(lines, sep='|', engine=parser, quoting=3, dtype=str, skipinitialspace=True,
+                             keep_default_na=False, na_filter=False)
+            df = df.drop(columns=lines.edgeColumns(df.columns))
+            df.columns = [c.strip() for c in df.columns]
+    finally:
+        lines.close()
+    return infer_quality_dtypes(df)
+
+
+def compact_quality_frame(df):
+    """
+    @brief: colonnes texte à faible cardinalité passées en category, en place ; un DataFrame rendu par
+            un process est ainsi picklé en codes et catégories plutôt qu'en une chaîne par ligne
+    df, pandas.DataFrame
+    return, pandas.DataFrame
+    """
+    for c in df.columns:
+        if df[c].dtype == object and df[c].nunique() <= CATEGORY_RATIO * len(df):
+            df[c] = df[c].astype('category')
+    return df
+
+
+def parse_quality_compact(file, parser="python"):
+    """
+    @brief: point d'entrée des process de QualityEngine.parseFiles, l'export est renvoyé compacté
+            (voir compact_quality_frame) avec les colonnes passées en category pour que le process
+            parent les remette en object (voir expand_quality_frame)
+    return, (pandas.DataFrame, list of str)
+    """
+    df = parse_quality_file(file, parser)
+    texts = [c for c in df.columns if df[c].dtype == object]
+    df = compact_quality_frame(df)
+    return df, [c for c in texts if isinstance(df[c].dtype, pd.CategoricalDtype)]
+
+
+def expand_quality_frame(df, cols):
+    """
+    @brief: inverse de compact_quality_frame, les colonnes cols repassent en object, en place
+    """
+    for c in cols:
+        df[c] = df[c].astype(object)
+    return df
+
+
+def iter_quality_chunks(file, parser="python", chunksize=CHUNK_ROWS, kinds=None):
+    """
+    @brief: version streaming de parse_quality_file, l'export est lu par read_csv(chunksize) et
+            chaque chunk est nettoyé et typé avant d'être rendu ; le typage du premier chunk est
+            imposé aux suivants (voir infer_quality_dtypes). Le parser "pyarrow" ne lit pas par
+            chunks, il est remplacé par le moteur C
+    file, str, chemin du fichier .txt
+    parser, str in PARSERS
+    chunksize, int, nombre de lignes par chunk
+    kinds, dict or None, typage des colonnes, complété au fil des chunks, voir write_quality_parts
+    yield, pandas.DataFrame
+    """
+    print('file : ', file)
+    if parser == "python":
+        for df in pd.read_csv(file, sep='|', header=3, encoding="latin-1", engine="python", quoting=3,
+                              chunksize=chunksize):
+            cols = [c.strip() for c in df.columns]
+            df.columns = cols
+            for c in cols:
+                df[c] = df[c].astype(str).str.strip()
+            yield df
+        return
+    if parser not in PARSERS:
+        raise ValueError("parser doit être dans {}".format(PARSERS))
+
+    lines = SapLineFilter(file)
+    if kinds is None:
+        kinds = {}
+    try:
+        for df in pd.read_csv(lines, sep='|', engine="c", quoting=3, dtype=str, skipinitialspace=True,
+                              keep_default_na=False, na_filter=False, chunksize=chunksize):
+            df = df.drop(columns=lines.edgeColumns(df.columns))
+            df.columns = [c.strip() for c in df.columns]
+            yield infer_quality_dtypes(df, kinds)
+    finally:
+        lines.close()
+
+
+def format_quality_text(values, kind):
+    """
+    @brief: valeurs converties par infer_quality_dtypes remises sous forme de texte ('' pour les
+            valeurs vides, entiers sans décimale, virgule décimale pour 'num,', dates jj.mm.aaaa)
+    values, pandas.Series, float64 ou datetime64
+    kind, str, type de la colonne, voir infer_quality_dtypes
+    return, pandas.Series, str
+    """
+    if kind == 'date':
+        return values.dt.strftime(DATE_FORMAT).fillna('').astype(object)
+    text = values.map(lambda v: '' if pd.isna(v) else ('%d' % v if float(v).is_integer() else repr(float(v))))
+    if kind == 'num,':
+        text = text.str.replace('.', ',', regex=False)
+    return text.astype(object)
+
+
+def write_quality_parts(dfs, folder, kinds=None):
+    """
+    @brief: écrit une suite de DataFrame dans folder, un fichier PART_NAME par DataFrame, chaque
+            DataFrame pouvant être libéré dès qu'il est écrit
+    dfs, iterable of pandas.DataFrame
+    folder, str, dossier existant
+    kinds, dict or None, typage partagé par les DataFrame (voir infer_quality_dtypes), complété au
+            fil des chunks ; à la fin, les parties écrites avec un autre typage sont réécrites
+            (colonne passée en texte, ou colonne vide dans les premiers chunks), toutes les parties
+            d'un export ont ainsi le même schéma. Si None, le typage est déduit des DataFrame
+    return, (int, dict), nombre de lignes écrites et typage des colonnes (voir quality_kinds)
+    """
+    nrows = 0
+    written = []
+    for i, df in enumerate(dfs):
+        path = os.path.join(folder, PART_NAME.format(i))
+        write_quality_part(df, path)
+        nrows += len(df)
+        # une colonne sans typage dans la partie y était entièrement vide
+        written.append((path, dict(kinds) if kinds is not None else quality_kinds(df)))
+    target = merge_quality_kinds([partKinds for path, partKinds in written])
+    if kinds is not None:
+        target.update(kinds)
+    for path, partKinds in written:
+        if all(same_quality_kind(partKinds.get(c), kind) for c, kind in target.items()):
+            continue
+        df = pq.read_table(path).to_pandas()
+        write_quality_part(convert_quality_kinds(df, partKinds, target), path)
+    return nrows, target
+
+
+def stream_quality_file(file, parser, chunksize, folder):
+    # point d'entrée des process du mode streaming, chaque process écrit ses parties lui-même
+    kinds = None if parser == "python" else {}
+    return write_quality_parts(iter_quality_chunks(file, parser, chunksize, kinds), folder, kinds)
+
+
+def file_signature(file, with_hash=True):
+    """
+    @brief: signature d'un export pour le manifeste : taille, mtime et sha1 du contenu
+    file, str, chemin du fichier
+    with_hash, boolean, si False le sha1 n'est pas calculé (None)
+    return, dict
+    """
+    st = os.stat(file)
+    sig = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha1': None}
+    if with_hash:
+        h = hashlib.sha1()
+        with open(file, 'rb') as fd:
+            for block in iter(lambda: fd.read(HASH_BLOCK), b''):
+                h.update(block)
+        sig['sha1'] = h.hexdigest()
+    return sig
+
+
+def write_quality_part(df, path):
+    """
+    @brief: écrit une partie du store parquet ; les colonnes texte à faible cardinalité sont
+            dictionnaire-encodées (category), avec des index int32 pour que toutes les parties
+            aient le même schéma quel que soit leur nombre de valeurs distinctes
+    df, pandas.DataFrame
+    path, str, fichier .parquet
+    """
+    df = compact_quality_frame(df.copy(deep=False))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = [pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type))
+              if pa.types.is_dictionary(f.type) else f for f in table.schema]
+    pq.write_table(table.cast(pa.schema(fields)), path)
+
+
 class QualityEngine:
     logger = logging.getLogger('quality_engine')
+    # colonnes des exports utilisées par défaut par les filtres de query
+    LOT_COL = 'Lot contrôle'
+    MATERIAL_COL = 'Article'
+    DATE_COL = 'Date'
 
-    def __init__(self, mode="run", store_option="pickle"):
+    def __init__(self, mode="run", store_option="pickle", workers=1, parser="python", chunksize=None):
         """
         @brief: run of read the quality related data
         mode, str in ['read', 'run']
+        workers, int or None, nombre de process pour parser les exports dans run, 1 : séquentiel,
+                None : un par coeur
+        parser, str in PARSERS, moteur de parsing des exports, voir parse_quality_file
+        store_option, str in ['pickle', 'hdf5', 'parquet'], avec 'parquet' la sortie est un dossier
+                mis à jour de façon incrémentale : seuls les exports nouveaux ou modifiés depuis le
+                run précédent (voir MANIFEST_FILE) sont parsés et écrits dans leur propre dossier
+        chunksize, int or None, avec le store 'parquet', mode streaming : les exports sont lus et
+                écrits par chunks de chunksize lignes (voir iter_quality_chunks), self.df n'est pas
+                gardé ; ignoré par les autres stores qui ont besoin du DataFrame complet
         """
         
         try:
@@ -35,7 +509,7 @@ class QualityEngine:
         except KeyError:
             print("WARNING : la variable environnement OUTPUT_QUALITY_FILE_PATH n'a pas été setté, valeur defaut : './'")
             self.output_quality_file_path = './quality.' + store_option
-            if os.path.exists(self.output_quality_file_path):
+            if os.path.exists(self.output_quality_file_path) and store_option != "parquet":
                 print('WARNING : file {} already exists, will be deleted'.format(self.output_quality_file_path))
         if store_option == "hdf5":            
             if mode == "run":
@@ -48,10 +522,21 @@ class QualityEngine:
             if mode == "readonly":
                 with open(self.output_quality_file_path, 'rb') as of:
                     self.df = pickle.load(of)
+        elif store_option == "parquet":
+            if pa is None:
+                raise ImportError("store_option='parquet' nécessite le package pyarrow")
+            print('store option is incremental parquet folder')
+
+            # en readonly rien n'est chargé, les lignes sont lues à la demande par query
 
         
         
         self.store_option = store_option
+        self.workers = workers
+        self.parser = parser
+        self.chunksize = chunksize
+        if chunksize is not None and store_option != "parquet":
+            print("WARNING : chunksize n'est utilisé qu'avec store_option='parquet'")
             
         
     def saveRes(self):
@@ -61,26 +546,296 @@ class QualityEngine:
         with open(self.output_quality_file_path, 'wb') as of:
             pickle.dump(self.df, of)
     
+    def manifestPath(self):
+        return os.path.join(self.output_quality_file_path, MANIFEST_FILE)
+
+    def loadManifest(self):
+        """
+        @brief: manifeste du store parquet, chemin de l'export : signature (voir file_signature),
+                nombre de lignes ('nrows') et typage des colonnes de l'export ('kinds', voir quality_kinds)
+        return, dict, vide si le store n'existe pas encore
+        """
+        if not os.path.isfile(self.manifestPath()):
+            return {}
+        with open(self.manifestPath(), 'r') as fd:
+            return json.load(fd)
+
+    def saveManifest(self, manifest):
+        # écriture atomique, un run interrompu laisse le manifeste précédent
+        tmp = self.manifestPath() + '.tmp'
+        with open(tmp, 'w') as fd:
+            json.dump(manifest, fd, indent=1)
+        os.replace(tmp, self.manifestPath())
+
+    def changedFiles(self, file_list, manifest):
+        """
+        @brief: exports nouveaux ou modifiés depuis le dernier run ; le sha1 n'est calculé que si la
+                taille ou le mtime diffèrent, un export simplement touché n'est pas reparsé
+        file_list, list of str, exports du dossier d'entrée
+        manifest, dict, voir loadManifest, mis à jour en place pour les exports touchés
+        return, list of (str, dict), export et sa nouvelle signature
+        """
+        changed = []
+        for file in file_list:
+            key = os.path.abspath(file)
+            old = manifest.get(key)
+            sig = file_signature(file, with_hash=False)
+            if old is not None and old['size'] == sig['size'] and old['mtime'] == sig['mtime']:
+                continue
+            sig = file_signature(file)
+            if old is not None and old['sha1'] == sig['sha1']:
+                old['mtime'] = sig['mtime']
+                continue
+            changed.append((file, sig))
+        return changed
+
+    def storeParts(self):
+        """
+        @brief: fichiers parquet du store, dans l'ordre des noms d'exports puis des parties
+        """
+        return sorted(glob(os.path.join(self.output_quality_file_path, '*', PART_NAME.replace('{:05d}', '*'))))
+
+    def exportKinds(self, file, sig):
+        """
+        @brief: typage des colonnes d'un export du store, celui du manifeste, ou déduit du schéma de
+                sa première partie pour un manifeste qui ne l'a pas
+        """
+        if sig.get('kinds') is not None:
+            return sig['kinds']
+        parts = sorted(glob(os.path.join(self.partFolder(file), PART_NAME.replace('{:05d}', '*'))))
+        if not parts:
+            return {}
+        kinds = {}
+        for f in pq.read_schema(parts[0]):
+            valueType = f.type.value_type if pa.types.is_dictionary(f.type) else f.type
+            if pa.types.is_timestamp(valueType):
+                kinds[f.name] = 'date'
+            elif pa.types.is_integer(valueType) or pa.types.is_floating(valueType):
+                kinds[f.name] = 'num'
+            else:
+                kinds[f.name] = 'text'
+        return kinds
+
+    def unifyStore(self, manifest):
+        """
+        @brief: une colonne typée différemment selon les exports (numérique dans l'un, texte comme 'n/a'
+                dans un autre) passe en texte dans tout le store : les parties des exports où elle est
+                typée sont réécrites (voir convert_quality_kinds) et leur typage est mis à jour dans le
+                manifeste, toutes les parties du store restent lisibles avec un même schéma
+        manifest, dict, voir loadManifest, mis à jour en place
+        """
+        kinds = {file: self.exportKinds(file, sig) for file, sig in manifest.items()}
+        target = merge_quality_kinds(kinds.values())
+        for file, sig in manifest.items():
+            if all(same_quality_kind(kind, target[c]) for c, kind in kinds[file].items()):
+                sig['kinds'] = kinds[file]
+                continue
+            print('export {} : colonnes remises en texte pour le store'.format(os.path.basename(file)))
+            for part in sorted(glob(os.path.join(self.partFolder(file), PART_NAME.replace('{:05d}', '*')))):
+                df = pq.read_table(part).to_pandas()
+                write_quality_part(convert_quality_kinds(df, kinds[file], target), part)
+            sig['kinds'] = {c: target[c] if target[c] is not None else kind for c, kind in kinds[file].items()}
+
+    def storeDataset(self, parts):
+        """
+        @brief: dataset pyarrow sur les parties du store, les schémas des parties sont unifiés
+                (une colonne entière dans un export et décimale dans un autre devient décimale,
+                les types incompatibles sont remis en texte à l'écriture, voir unifyStore)
+        """
+        metas = [pq.read_metadata(part) for part in parts]
+        schemas = [meta.schema.to_arrow_schema() for meta in metas]
+        # une colonne peut être dictionnaire-encodée dans une partie et pas dans une autre (nombre de
+        # valeurs distinctes), l'unification se fait sur les types valeurs et la colonne reste
+        # dictionnaire si c'est le cas de la majorité des lignes, le dataset ré-encode les autres
+        dictRows = {}
+        for meta, schema in zip(metas, schemas):
+            for f in schema:
+                dictRows[f.name] = dictRows.get(f.name, 0) + (meta.num_rows if pa.types.is_dictionary(f.type)
+                                                              else -meta.num_rows)
+        dictCols = {name for name, n in dictRows.items() if n > 0}
+        schemas = [pa.schema([pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f
+                              for f in schema]) for schema in schemas]
+        try:
+            schema = pa.unify_schemas(schemas, promote_options='permissive')
+        except TypeError:
+            schema = pa.unify_schemas(schemas)
+        schema = pa.schema([pa.field(f.name, pa.dictionary(pa.int32(), f.type)) if f.name in dictCols else f
+                            for f in schema])
+        return ds.dataset(parts, format='parquet', schema=schema)
+
+    def query(self, columns=None, lots=None, materials=None, start=None, end=None,
+              lot_col=None, material_col=None, date_col=None):
+        """
+        @brief: lecture du store parquet, seules les colonnes demandées et les row groups qui
+                peuvent contenir les lots, articles ou dates demandés sont lus
+        columns, list of str or None, colonnes à lire, toutes si None
+        lots, str or list of str or None, valeurs de lot_col à garder
+        materials, str or list of str or None, valeurs de material_col à garder
+        start, str or datetime or None, date_col >= start
+        end, str or datetime or None, date_col < end ; si date_col est resté texte (parser
+                "python"), les dates jj.mm.aaaa sont filtrées après lecture
+        lot_col, material_col, date_col, str or None, colonnes des exports utilisées par les
+                filtres, LOT_COL, MATERIAL_COL et DATE_COL si None
+        raises ValueError, si une colonne demandée ou filtrée n'est pas dans le store
+        return, pandas.DataFrame, les colonnes texte dictionnaire-encodées reviennent en category
+        """
+        if self.store_option != "parquet":
+            raise ValueError("query nécessite store_option='parquet'")
+        lot_col = self.LOT_COL if lot_col is None else lot_col
+        material_col = self.MATERIAL_COL if material_col is None else material_col
+        date_col = self.DATE_COL if date_col is None else date_col
+        parts = self.storeParts()
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        dataset = self.storeDataset(parts)
+
+        dateFilter = start is not None or end is not None
+        used = list(columns) if columns is not None else []
+        for col, active in [(lot_col, lots is not None), (material_col, materials is not None), (date_col, dateFilter)]:
+            if active:
+                used.append(col)
+        missing = [c for c in dict.fromkeys(used) if c not in dataset.schema.names]
+        if missing:
+            raise ValueError("colonnes absentes du store : {}, colonnes disponibles : {}".format(
+                missing, dataset.schema.names))
+
+        expr = None
+        conditions = []
+        for col, values in [(lot_col, lots), (material_col, materials)]:
+            if values is not None:
+                values = [values] if isinstance(values, str) else list(values)
+                conditions.append(ds.field(col).isin(values))
+        dateTyped = dateFilter and pa.types.is_timestamp(dataset.schema.field(date_col).type)
+        if dateTyped:
+            if start is not None:
+                conditions.append(ds.field(date_col) >= pd.Timestamp(start).to_datetime64())
+            if end is not None:
+                conditions.append(ds.field(date_col) < pd.Timestamp(end).to_datetime64())
+        for cond in conditions:
+            expr = cond if expr is None else expr & cond
+
+        readCols = columns
+        if dateFilter and not dateTyped and columns is not None and date_col not in columns:
+            readCols = list(columns) + [date_col]
+        df = dataset.to_table(columns=readCols, filter=expr).to_pandas()
+
+        if dateFilter and not dateTyped:
+            dates = pd.to_datetime(df[date_col].astype(str), format=DATE_FORMAT, errors='coerce')
+            keep = np.ones(len(df), dtype=bool)
+            if start is not None:
+                keep &= (dates >= pd.Timestamp(start)).to_numpy()
+            if end is not None:
+                keep &= (dates < pd.Timestamp(end)).to_numpy()
+            df = df[keep].reset_index(drop=True)
+            if readCols is not columns:
+                df = df[columns]
+        return df
+
+    def partFolder(self, file):
+        return os.path.join(self.output_quality_file_path, os.path.splitext(os.path.basename(file))[0])
+
+    def tmpFolder(self, file):
+        """
+        @brief: dossier vide dans lequel les parties d'un export sont écrites avant swapFolder
+        """
+        tmp = self.partFolder(file) + '.tmp'
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        return tmp
+
+    def swapFolder(self, file):
+        # remplace la version précédente de l'export une fois toutes ses parties écrites
+        folder = self.partFolder(file)
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+        os.rename(folder + '.tmp', folder)
+
+    def writeParts(self, file, dfs):
+        """
+        @brief: écrit les lignes d'un export dans son dossier du store, en remplaçant la version
+                précédente une fois l'écriture terminée
+        file, str, export source
+        dfs, iterable of pandas.DataFrame, parties à écrire, une par fichier parquet
+        return, (int, dict), nombre de lignes écrites et typage des colonnes
+        """
+        res = write_quality_parts(dfs, self.tmpFolder(file))
+        self.swapFolder(file)
+        return res
+
+    def parseFiles(self, file_list):
+        """
+        @brief: exports parsés (voir parse_quality_file) ; les process renvoient les colonnes texte
+                répétitives en category (voir parse_quality_compact) pour limiter ce qui est picklé,
+                elles sont remises en object pour que le résultat ne dépende pas de workers
+        return, list of pandas.DataFrame
+        """
+        if self.workers == 1 or len(file_list) < 2:
+            return [parse_quality_file(file, self.parser) for file in file_list]
+        # map rend les résultats dans l'ordre de file_list, la concaténation reste déterministe
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return [expand_quality_frame(df, cols) for df, cols in
+                    executor.map(parse_quality_compact, file_list, [self.parser] * len(file_list))]
+
+    def streamFiles(self, file_list):
+        """
+        @brief: mode streaming, chaque export est lu par chunks de self.chunksize lignes et chaque
+                chunk est écrit dans sa propre partie, la mémoire est bornée par la taille d'un chunk
+                (par process) quel que soit le nombre d'exports
+        file_list, list of str, exports à écrire
+        return, list of (int, dict), nombre de lignes écrites et typage des colonnes par export
+        """
+        folders = [self.tmpFolder(file) for file in file_list]
+        n = len(file_list)
+        if self.workers == 1 or n < 2:
+            res = list(map(stream_quality_file, file_list, [self.parser] * n, [self.chunksize] * n, folders))
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                res = list(executor.map(stream_quality_file, file_list, [self.parser] * n,
+                                        [self.chunksize] * n, folders))
+        for file in file_list:
+            self.swapFolder(file)
+        return res
+
+    def runIncremental(self, file_list):
+        """
+        @brief: run du store parquet, seuls les exports nouveaux ou modifiés sont parsés, les
+                lignes des exports retirés du dossier d'entrée restent dans le store
+        file_list, list of str, exports du dossier d'entrée
+        """
+        os.makedirs(self.output_quality_file_path, exist_ok=True)
+        manifest = self.loadManifest()
+        changed = self.changedFiles(file_list, manifest)
+        print('{} exports nouveaux ou modifiés sur {}'.format(len(changed), len(file_list)))
+        if self.chunksize is not None:
+            written = self.streamFiles([file for file, sig in changed])
+            # en streaming aucune ligne n'est gardée en mémoire
+            self.df = None
+        else:
+            self.df_list = self.parseFiles([file for file, sig in changed])
+            written = [self.writeParts(file, [df]) for (file, sig), df in zip(changed, self.df_list)]
+            # self.df ne contient que les lignes ajoutées par ce run
+            self.df = concat_quality_frames(self.df_list)
+            del self.df_list
+        for (file, sig), (n, kinds) in zip(changed, written):
+            sig['nrows'] = n
+            sig['kinds'] = kinds
+            manifest[os.path.abspath(file)] = sig
+        self.unifyStore(manifest)
+        self.saveManifest(manifest)
+
     def run(self):
         self.logger.info('Quality engine START')
         
-        self.df_list = []
         file_list = glob(self.input_quality_file_path + '*.txt')
         file_list = sorted(file_list, key=lambda r: os.path.basename(r))
-        for file in file_list:
-            res_v = None
-            labels = []
-            print('file : ', file)
-            df = pd.read_csv(file, sep='|', header=3, encoding="latin-1", engine="python", quoting=3)
-            cols = df.columns
-            cols = [c.strip() for c in cols]
-            df.columns = cols
-            for c in cols:
-                #if df[c].dtype == str:
-                df[c] = df[c].astype(str).str.strip()
-            self.df_list.append(df)
-        
-        self.df = pd.concat(self.df_list)
+        if self.store_option == "parquet":
+            self.runIncremental(file_list)
+            self.logger.info('Quality engine STOP')
+            return
+
+        self.df_list = self.parseFiles(file_list)
+        self.df = concat_quality_frames(self.df_list)
         del self.df_list
         if self.store_option == "hdf5":
             self.hdf5_manager.addFromDataframe(self.df)
@@ -89,4 +844,3 @@ class QualityEngine:
             self.saveRes()
             
         self.logger.info('Quality engine STOP')
-
@@ -2,21 +2,194 @@
 import os
 import json
 import numpy as np
-import dask.bag as db
+try:
+    import dask.bag as db
+except ImportError:
+    db = None
 from datetime import datetime
-import pickle
+import marshal
+import hashlib
+import gc
+import tempfile
 from pickle_reader import PickleReader
 from events_engine import EventsEngine
 import re
+from bisect import bisect_left, bisect_right
+
+# niveaux de l'arbre des recettes, un élément a pour enfants les ids du niveau suivant qui commencent par son id
+LEVELS = ['etapes', 'sequences', 'operations', 'fonctions']
+# collections dont les modifications sont indexées pour les recherches par suffixe
+MODIF_COLLECTIONS = ['sequences', 'operations', 'fonctions']
+# borne haute des clés qui commencent par un préfixe donné, voir prefixRange
+MAX_CHAR = '\U0010ffff'
+# cache des dictionnaires dérivés des json de l'arbre des recettes, voir QueryEngine.refreshCache ;
+# CACHE_VERSION est à incrémenter quand le contenu du cache change
+CACHE_FILE = 'QUERY_CACHE.marshal'
+CACHE_VERSION = 2
+HASH_BLOCK = 1 << 20
+# lecture des json de l'arbre des recettes : "json" charge le document entier, "stream" lit les éléments
+# un par un (BASE.jsonl s'il existe, sinon BASE.json avec iter_json_array)
+JSON_PARSERS = ['json', 'stream']
+JSON_CHUNK = 1 << 20
+# champs utilisés par les requêtes, à passer en keep_fields pour ne garder qu'eux dans global_dict
+QUERY_FIELDS = ['id', 'modifications', 'etape_associee', 'temps_executer', 'temps_terminer']
+MODIF_RE = re.compile('D[.1-9]* (.*)')
+ARRAY_SEP_RE = re.compile(r'[\s,]*')
+# attribut du QueryEngine : fichier json de la collection
+COLLECTIONS = {'recettes': 'RECETTES', 'etapes': 'ETAPES', 'sequences': 'SEQUENCES', 'operations': 'OPERATIONS',
+               'fonctions': 'FONCTIONS', 'capteurs': 'CAPTEURS', 'operateurs': 'OPERATEURS'}
+
+
+def source_signature(fpath, with_hash=True):
+    """
+    brief : signature d'un fichier source du cache : taille, mtime et sha1 du contenu
+    fpath, str, chemin du fichier
+    with_hash, boolean, si False le sha1 n'est pas calculé (None)
+    """
+    st = os.stat(fpath)
+    sig = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha1': None}
+    if with_hash:
+        h = hashlib.sha1()
+        with open(fpath, 'rb') as fo:
+            for block in iter(lambda: fo.read(HASH_BLOCK), b''):
+                h.update(block)
+        sig['sha1'] = h.hexdigest()
+    return sig
+
+
+def iter_json_array(fpath, chunk_size=JSON_CHUNK):
+    """
+    brief : éléments d'un tableau json lus un par un, sans charger le document entier : le fichier est lu
+            par blocs de chunk_size caractères et chaque élément décodé par raw_decode dès qu'il est complet
+    fpath, str, chemin d'un fichier contenant un tableau json
+    """
+    decoder = json.JSONDecoder()
+    with open(fpath, 'r', encoding='utf-8') as fo:
+        buf = fo.read(chunk_size)
+        eof = not buf
+        pos = 0
+        started = False
+        while True:
+            # saute les blancs et les ',' entre les éléments, puis le '[' initial
+            pos = ARRAY_SEP_RE.match(buf, pos).end()
+            if not started and pos < len(buf):
+                if buf[pos] != '[':
+                    raise ValueError('{} ne contient pas un tableau json'.format(fpath))
+                started = True
+                pos += 1
+                continue
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            if pos < len(buf):
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # un élément qui finit pile en fin de bloc peut être tronqué (nombre), on relit
+                    if end < len(buf) or eof:
+                        yield obj
+                        pos = end
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                if started:
+                    raise ValueError('tableau json non terminé dans {}'.format(fpath))
+                return
+            more = fo.read(chunk_size)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+
+
+def iter_json_records(fpath, jsonl=False):
+    """
+    brief : enregistrements d'une collection lus un par un, .jsonl : un enregistrement par ligne, sinon
+            tableau json par iter_json_array
+    """
+    if jsonl:
+        with open(fpath, 'r', encoding='utf-8') as fo:
+            for line in fo:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        for obj in iter_json_array(fpath):
+            yield obj
+
+
+class MemoryBag:
+    """
+    brief : collection chargée une fois en mémoire, avec le sous-ensemble de l'api dask.bag utilisé par
+            QueryEngine (filter, map, flatten, distinct, compute), les opérations sont faites tout de
+            suite sur la liste, sans relire le json ni passer par le scheduler dask
+    """
+    __slots__ = ['records']
+
+    def __init__(self, records):
+        self.records = records
+
+    @classmethod
+    def fromJson(cls, fpath):
+        """
+        brief : même lecture que getDb en dask : chaque ligne du fichier est un document json, dont les
+                éléments sont les enregistrements de la collection
+        """
+        records = []
+        with open(fpath, 'r', encoding='utf-8') as fo:
+            for line in fo:
+                if line.strip():
+                    records.extend(json.loads(line))
+        return cls(records)
+
+    def filter(self, func):
+        return MemoryBag([r for r in self.records if func(r)])
+
+    def map(self, func):
+        return MemoryBag([func(r) for r in self.records])
+
+    def flatten(self):
+        return MemoryBag([e for r in self.records for e in r])
+
+    def distinct(self):
+        return MemoryBag(list(dict.fromkeys(self.records)))
+
+    def compute(self):
+        return list(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
 
 class QueryEngine:
     
-    def __init__(self, storage_option="jsonfile"):
-        
+    def __init__(self, storage_option="jsonfile", dask_collections=None, json_parser="json", keep_fields=None):
+        """
+        storage_option, str, seul 'jsonfile' est supporté
+        dask_collections, list of str or None, collections (clés de COLLECTIONS) gardées en dask.bag lazy,
+                relues à chaque requête, pour celles trop grosses pour la mémoire ; les autres sont
+                chargées en MemoryBag à leur première utilisation (voir __getattr__), une collection
+                que les index et global_dict rendent inutile n'est jamais chargée
+        json_parser, str in JSON_PARSERS, lecture des json de l'arbre des recettes pour global_dict,
+                "stream" garde le pic mémoire proportionnel aux données retenues
+        keep_fields, list of str or None, champs gardés dans les enregistrements de global_dict (par
+                exemple QUERY_FIELDS), 'id' et 'modifications' toujours inclus, tous si None
+        """
         
         if storage_option != "jsonfile":
             raise ValueError('seul storage_option=jsonfile est supporté pour le moteur de requete')
         
+        self.dask_collections = list(dask_collections) if dask_collections is not None else []
+        for coll in self.dask_collections:
+            if coll not in COLLECTIONS:
+                raise ValueError('collection {} not in {}'.format(coll, list(COLLECTIONS)))
+        if self.dask_collections and db is None:
+            raise ImportError('dask_collections nécessite le package dask')
+        if json_parser not in JSON_PARSERS:
+            raise ValueError('json_parser doit être dans {}'.format(JSON_PARSERS))
+        self.json_parser = json_parser
+        self.keep_fields = None if keep_fields is None else sorted(set(keep_fields) | {'id', 'modifications'})
         self.sensor_reader = PickleReader()
         try:
             self.json_file_path = os.environ['JSON_FILE_PATH']
@@ -26,78 +199,234 @@ class QueryEngine:
             print("WARNING : la variable environnement JSON_FILE_PATH n'a pas été setté, valeur defaut : './'")
             self.json_file_path = './'
             
-        self.recettes = self.getDb(self.json_file_path + 'RECETTES.json')
-        self.etapes = self.getDb(self.json_file_path + 'ETAPES.json')
-        self.sequences = self.getDb(self.json_file_path + 'SEQUENCES.json')
-        self.operations = self.getDb(self.json_file_path + 'OPERATIONS.json')
-        self.fonctions = self.getDb(self.json_file_path + 'FONCTIONS.json')
-        self.capteurs = self.getDb(self.json_file_path + 'CAPTEURS.json')
-        self.operateurs = self.getDb(self.json_file_path + 'OPERATEURS.json')
+        for coll in self.dask_collections:
+            setattr(self, coll, self.getDb(self.json_file_path + COLLECTIONS[coll] + '.json', lazy=True))
         
 
         
-        if os.path.exists(self.json_file_path + 'MODIF_DICT.pickle'):
-            with open(self.json_file_path + 'GLOBAL_DICTS.pickle', 'rb') as of:
-                self.global_dict = pickle.load(of)
-            with open(self.json_file_path + 'LIST_ID.pickle', 'rb') as of:
-                self.list_id = pickle.load(of)
-            with open(self.json_file_path + 'LIST_MODIF.pickle', 'rb') as of:
-                self.list_modif = pickle.load(of)
-            with open(self.json_file_path + 'MODIF_DICT.pickle', 'rb') as of:
-                self.modif_dict = pickle.load(of)
-            
-        else:
-            self.convertDbsToDicts()
-            with open(self.json_file_path + 'GLOBAL_DICTS.pickle', 'wb') as of:
-                pickle.dump(self.global_dict, of)
-            with open(self.json_file_path + 'LIST_ID.pickle', 'wb') as of:
-                pickle.dump(self.list_id, of)
-            with open(self.json_file_path + 'LIST_MODIF.pickle', 'wb') as of:
-                pickle.dump(self.list_modif, of)
-            with open(self.json_file_path + 'MODIF_DICT.pickle', 'wb') as of:
-                pickle.dump(self.modif_dict, of)
-                
-            if not os.path.exists(self.json_file_path + 'GLOBAL_DICTS.pickle'):
-                raise FileNotFoundError(self.json_file_path + 'GLOBAL_DICTS.pickle')
+        self.refreshCache()
+
+        self.buildIndexes()
+
+    def __getattr__(self, name):
+        """
+        brief : chargement d'une collection de COLLECTIONS en MemoryBag au premier accès, gardée ensuite
+                comme attribut ; appelé seulement pour les attributs absents
+        """
+        if name not in COLLECTIONS or 'json_file_path' not in self.__dict__:
+            raise AttributeError(name)
+        bag = self.getDb(self.json_file_path + COLLECTIONS[name] + '.json')
+        setattr(self, name, bag)
+        return bag
+
+    @staticmethod
+    def prefixRange(sorted_keys, prefix):
+        """
+        brief : bornes [lo, hi) des clés de sorted_keys qui commencent par prefix, en O(log N)
+        """
+        return bisect_left(sorted_keys, prefix), bisect_right(sorted_keys, prefix + MAX_CHAR)
+
+    @staticmethod
+    def indexBy(bag, field):
+        """
+        brief : index valeur de field : enregistrements, dans l'ordre de la collection
+        """
+        index = {}
+        for r in bag:
+            index.setdefault(r.get(field), []).append(r)
+        return index
+
+    def buildIndexes(self):
+        """
+        brief : index secondaires construits au chargement, capteurs par nom, operateurs par lib (None si
+                la collection est restée en dask, les requêtes font alors un scan) et modifications
+                renversées triées pour les recherches par suffixe de get_by_modifications_rapid
+        """
+        self.capteurs_by_nom = None if 'capteurs' in self.dask_collections else self.indexBy(self.capteurs, 'nom')
+        self.operateurs_by_lib = None if 'operateurs' in self.dask_collections else self.indexBy(self.operateurs, 'lib')
+        self.reversed_modif = sorted({m[::-1] for base in MODIF_COLLECTIONS for m in self.list_modif[base]})
+        # niveau de chaque id et rang dans global_dict, pour rendre les enfants dans l'ordre des json
+        self.id_level = {k: coll for coll in LEVELS for k in self.list_id[coll]}
+        self.id_rank = {k: i for i, k in enumerate(self.global_dict)}
+
+    def get_children_ids(self, parent_id, coll):
+        """
+        brief : ids de la collection coll qui commencent par parent_id, par plage de bisect sur list_id[coll]
+                trié, en O(log N + k)
+        parent_id, str, id du parent
+        coll, str in LEVELS
+        """
+        ids = self.list_id[coll]
+        lo, hi = self.prefixRange(ids, parent_id)
+        return ids[lo:hi]
+
+    def get_children_by_rank(self, parent_id, coll):
+        # enfants dans l'ordre de global_dict, comme le parcours de global_dict qu'ils remplacent
+        ids = sorted(self.get_children_ids(parent_id, coll), key=self.id_rank.__getitem__)
+        return [self.global_dict[k] for k in ids]
+
+    def get_subtree(self, parent_id, max_level=None):
+        """
+        brief : sous-arbre complet d'un élément, pour les simulations
+        parent_id, str, id d'un élément de global_dict
+        max_level, str in LEVELS or None, dernier niveau descendu, jusqu'aux fonctions si None
+        return, dict, {'element': enregistrement, 'level': niveau, 'children': [sous-arbres du niveau
+                suivant]} ou None si parent_id est inconnu
+        """
+        level = self.id_level.get(parent_id)
+        if level is None:
+            print('{} not found'.format(parent_id))
+            return None
+        last = LEVELS.index(max_level) if max_level is not None else len(LEVELS) - 1
+        return self.buildSubtree(parent_id, LEVELS.index(level), last)
+
+    def buildSubtree(self, node_id, depth, last):
+        children = []
+        if depth < last:
+            children = [self.buildSubtree(k, depth + 1, last)
+                        for k in sorted(self.get_children_ids(node_id, LEVELS[depth + 1]), key=self.id_rank.__getitem__)]
+        return {'element': self.global_dict[node_id], 'level': LEVELS[depth], 'children': children}
         
-    def convertDbsToDicts(self):
+    def loadCache(self):
         """
-        brief 
+        brief : contenu du cache, None s'il n'existe pas, est illisible ou d'une autre CACHE_VERSION
+        """
+        fpath = self.json_file_path + CACHE_FILE
+        if not os.path.isfile(fpath):
+            return None
+        # marshal.loads sur le contenu lu d'un bloc est bien plus rapide que marshal.load sur le fichier,
+        # le gc est suspendu pendant la création des millions d'objets du cache
+        with open(fpath, 'rb') as of:
+            data = of.read()
+        gc.disable()
+        try:
+            cache = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            print('WARNING : cache {} illisible, il sera reconstruit'.format(fpath))
+            return None
+        finally:
+            gc.enable()
+        if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+            return None
+        return cache
+
+    def saveCache(self, cache):
+        # écriture dans un fichier temporaire propre à ce process puis rename, un process qui lit le cache
+        # en même temps voit l'ancienne ou la nouvelle version, jamais un fichier partiel, et deux process
+        # qui le réécrivent en même temps ne partagent pas le fichier temporaire
+        fpath = self.json_file_path + CACHE_FILE
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fpath)), prefix=CACHE_FILE + '.')
+        try:
+            with os.fdopen(fd, 'wb') as of:
+                of.write(marshal.dumps(cache))
+            os.replace(tmp, fpath)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def refreshCache(self):
+        """
+        brief : charge les dictionnaires dérivés depuis CACHE_FILE ; chaque collection n'est reconvertie
+                que si son json a changé : taille ou mtime différents et sha1 différent (un json
+                simplement touché ne met à jour que sa signature), le cache est réécrit si besoin
+        """
+        cache = self.loadCache()
+        if cache is None:
+            cache = {'version': CACHE_VERSION, 'collections': {}}
+        collections = cache['collections']
+        changed = False
+        rebuilt = []
+        for base in LEVELS:
+            fpath = self.sourcePath(base)
+            entry = collections.get(base)
+            # les champs gardés font partie de la clé, changer keep_fields reconvertit la collection
+            if entry is not None and (entry['source'] != fpath or entry['keep_fields'] != self.keep_fields):
+                entry = None
+            sig = source_signature(fpath, with_hash=False)
+            if entry is not None and entry['sig']['size'] == sig['size'] and entry['sig']['mtime'] == sig['mtime']:
+                continue
+            sig = source_signature(fpath)
+            changed = True
+            if entry is not None and entry['sig']['sha1'] == sig['sha1']:
+                entry['sig'] = sig
+                continue
+            entry = self.convertCollection(base)
+            entry['sig'] = sig
+            entry['source'] = fpath
+            entry['keep_fields'] = self.keep_fields
+            collections[base] = entry
+            rebuilt.append(base)
+        if changed:
+            print('cache {}, collections reconstruites : {}'.format(CACHE_FILE, rebuilt))
+            self.saveCache(cache)
+        self.assembleDicts(collections)
+
+    def sourcePath(self, coll):
+        """
+        brief : fichier lu pour une collection, BASE.jsonl en mode "stream" s'il existe, sinon BASE.json
+        """
+        base = self.json_file_path + COLLECTIONS[coll]
+        if self.json_parser == "stream" and os.path.isfile(base + '.jsonl'):
+            return base + '.jsonl'
+        return base + '.json'
+
+    def readRecords(self, coll):
+        fpath = self.sourcePath(coll)
+        if self.json_parser == "stream":
+            return iter_json_records(fpath, jsonl=fpath.endswith('.jsonl'))
+        with open(fpath, 'rb') as of:
+            return json.load(of)
+
+    def convertCollection(self, coll):
+        """
+        brief : conversion d'une collection de l'arbre des recettes, enregistrement par enregistrement ;
+                en mode "stream" seuls les enregistrements retenus (champs keep_fields) restent en mémoire
+        coll, str in LEVELS
+        return, dict, 'records' : enregistrements dans l'ordre du json, modifications normalisées (préfixe
+                'D1.2 ' retiré), 'ids' et 'modifs' : ids et modifications triés
+        """
+        print('converting ', COLLECTIONS[coll])
+        records = []
+        ids = []
+        modifs = []
+        # json.load partage les clés entre enregistrements, pas un décodage élément par élément
+        keys = {}
+        for v in self.readRecords(coll):
+            if self.keep_fields is not None:
+                v = {k: v[k] for k in self.keep_fields if k in v}
+            elif self.json_parser == "stream":
+                v = {keys.setdefault(k, k): x for k, x in v.items()}
+            if coll != 'etapes':
+                reg = MODIF_RE.search(v['modifications'])
+                if reg:
+                    v['modifications'] = reg.group(1)
+                modifs.append(v['modifications'])
+            ids.append(v['id'])
+            records.append(v)
+        return {'records': records, 'ids': sorted(ids), 'modifs': sorted(modifs)}
+
+    def assembleDicts(self, collections):
+        """
+        brief : global_dict, list_id, list_modif et modif_dict à partir des collections converties
+        collections, dict, coll in LEVELS : résultat de convertCollection
         """
         global_dict = {}
-        list_id = {'etapes': [], 'sequences': [], 'operations': [], 'fonctions': []}
-        list_modif = {'etapes': [], 'sequences': [], 'operations': [], 'fonctions': []}
         modif_dict = {}
-        
-    
-        for i, base in enumerate(['ETAPES', 'SEQUENCES', 'OPERATIONS', 'FONCTIONS']):
-           
-            print('converting ', base)
-            baselower = base.lower()        
-            with open(self.json_file_path + base + '.json', 'rb') as of:
-                bj = json.load(of)
-                for v in bj:
-                    if base != 'ETAPES':
-                        reg = re.search('D[.1-9]* (.*)', v['modifications'])
-                        if reg:
-                            v['modifications'] = reg.group(1)
-                        modif_dict[v['modifications']] = [v]
-                        list_modif[baselower].append(v['modifications'])
-                            
-
-                    global_dict[v['id']] = v
-                    list_id[baselower].append(v['id'])
-                
-                    
-            
+        for coll in LEVELS:
+            for v in collections[coll]['records']:
+                if coll != 'etapes':
+                    modif_dict[v['modifications']] = [v]
+                global_dict[v['id']] = v
         self.global_dict = global_dict
-        self.list_id = list_id
-        self.list_modif = list_modif
         self.modif_dict = modif_dict
+        self.list_id = {coll: collections[coll]['ids'] for coll in LEVELS}
+        self.list_modif = {coll: collections[coll]['modifs'] for coll in LEVELS}
 
-        for u in ['etapes', 'sequences', 'operations', 'fonctions']:
-            self.list_id[u] = sorted(list_id[u])
-            self.list_modif[u] = sorted(list_modif[u])
+    def convertDbsToDicts(self):
+        """
+        brief : reconversion complète des json de l'arbre des recettes, sans passer par le cache
+        """
+        self.assembleDicts({coll: self.convertCollection(coll) for coll in LEVELS})
     
     def getJson(self, fpath):
         res = None
@@ -109,7 +438,14 @@ class QueryEngine:
         
         return res['data']
     
-    def getDb(self, fpath):
+    def getDb(self, fpath, lazy=False):
+        """
+        brief : collection d'un fichier json
+        fpath, str, chemin du fichier
+        lazy, boolean, si True dask.bag relu à chaque compute, sinon MemoryBag chargé une fois
+        """
+        if not lazy:
+            return MemoryBag.fromJson(fpath)
         b = db.read_text([fpath]).map(json.loads)
         b = b.flatten()
         return b
@@ -118,6 +454,8 @@ class QueryEngine:
         """
         brief 
         """
+        if self.capteurs_by_nom is not None:
+            return [v for r in self.capteurs_by_nom.get(capteur, []) for v in [r['unite'], r['type']]]
         return self.capteurs.filter(lambda r: r['nom'] == capteur).map(lambda r: [r['unite'], r['type']]).flatten().compute()
     
     def get_ids(self, coll='fonctions'):
@@ -128,7 +466,7 @@ class QueryEngine:
         
     
     def get_operateurs(self):
-        return self.operateurs.filter_map(mapfunc=lambda r: r['creation'], compute=True, flatten=False)
+        return self.filter_map('operateurs', mapfunc=lambda r: r['creation'], compute=True, flatten=False)
     
     def get_operateur_of_etape(self, etape, fullname=False):
 
@@ -136,9 +474,13 @@ class QueryEngine:
         if fullname:
             id_field = 'user'
             
+        if self.operateurs_by_lib is not None:
+            return [r[id_field] for r in self.operateurs_by_lib.get(etape, [])]
         return self.filter_map('operateurs', filterfunc=lambda r: r['lib']==etape, mapfunc=lambda r: r[id_field], flatten=False)
     
     def get_operateur_info_of_etape(self, etape):
+        if self.operateurs_by_lib is not None:
+            return list(self.operateurs_by_lib.get(etape, []))
         return self.filter_map('operateurs', filterfunc=lambda r: r['lib']==etape, compute=True, flatten=False)
 
 
@@ -192,11 +534,10 @@ class QueryEngine:
         if exactmatch:
             return self.modif_dict.get(modifications, [])
         else:
-            list_modifs = []
-            for base in ['sequences', 'operations', 'fonctions']:
-                aux_l = [m for m in self.list_modif[base] if m.endswith(modifications)]
-                list_modifs += aux_l
-            list_modifs = list(set(list_modifs))
+            # les modifications qui finissent par modifications sont celles dont le renversé commence
+            # par modifications renversé, une plage contiguë de reversed_modif
+            lo, hi = self.prefixRange(self.reversed_modif, modifications[::-1])
+            list_modifs = [m[::-1] for m in self.reversed_modif[lo:hi]]
             res = []
             for e in list_modifs:
                 res += self.modif_dict[e]
@@ -248,8 +589,7 @@ class QueryEngine:
         pass
     
     def get_sequences_by_etape_id(self, etape_id):
-        res = [self.global_dict[k] for k in self.global_dict.keys() if k.startswith(etape_id) and k in self.list_id['sequences']] 
-        return res
+        return self.get_children_by_rank(etape_id, 'sequences')
     
     def get_operations_by_parent_id(self, parent_id):
         """
@@ -259,8 +599,7 @@ class QueryEngine:
         parent, str in ["sequence", "etape_lot", "lot"]
         arg, str, field to keep from the operation objects in results, e.g. : modifications, id ..
         """
-        res = [self.global_dict[k] for k in self.global_dict.keys() if k.startswith(parent_id) and k in self.list_id['operations']]
-        return res
+        return self.get_children_by_rank(parent_id, 'operations')
     
       
     def get_elements_by_parent_id(self, parent_id, element_type=None, arg=None):
@@ -276,15 +615,12 @@ class QueryEngine:
         if element_type not in ['fonctions', 'etapes', 'operations', 'sequences'] :
             raise ValueError("element_type doit être renseigne. choix possible : 'etapes', 'sequences', 'operations', 'fonctions'")
         
-        res = [self.global_dict[k] for k in self.global_dict.keys() if k.startswith(parent_id) and k in self.list_id[element_type]]
-        return res
+        return self.get_children_by_rank(parent_id, element_type)
     
     def get_fonctions_by_parent_id(self, parent_id):
         """
         """
-        vals = [k for k in self.list_id['fonctions'] if k.startswith(parent_id)]
-        res = [self.global_dict[v] for v in vals]
-        return res
+        return [self.global_dict[k] for k in self.get_children_ids(parent_id, 'fonctions')]
 
     def get_element_by_id(self, id_val):
         """
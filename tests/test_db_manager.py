@@ -0,0 +1,142 @@
+import threading
+
+import numpy
+import pandas as pd
+
+from db_manager import DBManager, TIME_COL
+
+
+def sensors(n, start='2020-01-01', freq='s', seed=0):
+    rng = numpy.random.default_rng(seed)
+    return pd.DataFrame({TIME_COL: pd.date_range(start, periods=n, freq=freq),
+                         'A': rng.random(n).astype('float32'), 'B': rng.random(n)})
+
+
+def manager(tmp_path, **kwargs):
+    return DBManager(db_url='sqlite:///{}'.format(tmp_path / 'sensors.db'), **kwargs)
+
+
+def test_fast_time_query_slice_bounds(tmp_path):
+    dbm = manager(tmp_path)
+    df = sensors(1000)
+    # rows inserted out of order, the in memory frame is sorted once
+    dbm.importFromDataframe(df.iloc[::-1], 'sensors', method='copy')
+    dbm.initFastTimeQuery()
+    start, end = pd.Timestamp('2020-01-01 00:01:00'), pd.Timestamp('2020-01-01 00:02:00')
+    res = dbm.fastTimeQuery(start, end)
+    expected = df[(df[TIME_COL] >= start) & (df[TIME_COL] <= end)]
+    # both bounds included
+    assert len(res) == 61
+    numpy.testing.assert_array_equal(res[TIME_COL].to_numpy(), expected[TIME_COL].to_numpy())
+    numpy.testing.assert_allclose(res['B'].to_numpy(dtype='float64'), expected['B'].to_numpy())
+    assert list(dbm.fastTimeQuery('2020-01-01 00:01:00', '2020-01-01 00:01:00', columns=['A']).columns) == ['A']
+    assert len(dbm.fastTimeQuery('2019-01-01 00:00:00', '2019-12-31 00:00:00')) == 0
+    # raw timeQuery excludes both bounds
+    assert len(dbm.timeQuery('2020-01-01 00:01:00', '2020-01-01 00:02:00').all()) == 59
+
+
+def test_snapshot_round_trip(tmp_path):
+    cacheDir = str(tmp_path / 'cache')
+    dbm = manager(tmp_path)
+    df = sensors(2000)
+    dbm.importFromDataframe(df, 'sensors', method='copy')
+    dbm.initFastTimeQuery(cacheDir=cacheDir)
+    first = dbm.resall.copy()
+
+    # second load : memory mapped snapshot, nothing fetched
+    dbm = manager(tmp_path)
+    dbm.initFastTimeQuery(cacheDir=cacheDir)
+    assert isinstance(dbm.resallBuffers[0], numpy.memmap) or isinstance(dbm.resallBuffers[0].base, numpy.memmap)
+    pd.testing.assert_frame_equal(dbm.resall, first)
+
+    # new rows : only them are fetched and the snapshot is rewritten
+    new = sensors(10, start='2020-01-02')
+    dbm.insertManyInTable('sensors', new.to_records(index=False))
+    dbm = manager(tmp_path)
+    dbm.initFastTimeQuery(cacheDir=cacheDir)
+    assert len(dbm.resall) == 2010
+    numpy.testing.assert_array_equal(dbm.resall[TIME_COL].to_numpy()[-10:], new[TIME_COL].to_numpy())
+    dbm = manager(tmp_path)
+    dbm.initFastTimeQuery(cacheDir=cacheDir)
+    assert len(dbm.resallBuffers[0]) == 2010
+
+
+def test_refresh_only_new_rows(tmp_path):
+    dbm = manager(tmp_path)
+    dbm.importFromDataframe(sensors(500), 'sensors', method='copy')
+    dbm.initFastTimeQuery(stream=True, chunksize=64)
+    assert dbm.refreshFastTimeQuery() == 0
+    rows = [{TIME_COL: pd.Timestamp('2020-01-02').to_pydatetime() + pd.Timedelta(seconds=i), 'A': float(i), 'B': 2.0 * i}
+            for i in range(3)]
+    assert dbm.insertManyInTable('sensors', rows, batchsize=2) == 3
+    assert dbm.refreshFastTimeQuery() == 3
+    assert dbm.refreshFastTimeQuery() == 0
+    assert len(dbm.resall) == 503
+    assert dbm.resall['B'].tolist()[-3:] == [0.0, 2.0, 4.0]
+    assert dbm.fastTimeQuery('2020-01-02 00:00:01', '2020-01-02 00:00:02')['A'].tolist() == [1.0, 2.0]
+
+
+def test_copy_from_dataframe_column_types(tmp_path):
+    # sqlite has no COPY, rows are inserted by executemany
+    dbm = manager(tmp_path)
+    dbm.copyFromDataframe(sensors(100), 'sensors', chunksize=30)
+    cols = {c.name: c.type for c in dbm.tables['sensors'].columns}
+    assert str(cols['A']) == 'REAL'
+    assert str(cols['B']) == 'FLOAT'
+    assert len(dbm.timeQuery('2019-12-31 00:00:00', '2020-01-02 00:00:00').all()) == 100
+
+
+def test_refresh_appends_without_copying_time(tmp_path):
+    dbm = manager(tmp_path, poolSize=4)
+    dbm.importFromDataframe(sensors(1000), 'sensors', method='copy')
+    dbm.initFastTimeQuery(stream=True)
+    new = sensors(10, start='2020-01-02')
+    dbm.importFromDataframe(new, 'sensors', ifExists='append', method='copy')
+
+    # both refreshes read the last TIME, only one of them fetches the new rows
+    added = []
+    threads = [threading.Thread(target=lambda: added.append(dbm.refreshFastTimeQuery())) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(added) == [0, 10]
+    assert len(dbm.resall) == 1010
+    assert dbm.resall[TIME_COL].is_unique
+    # TIME and the values stay views of the growable buffers
+    assert numpy.shares_memory(dbm.resall[TIME_COL].to_numpy(), dbm.resallTime)
+    assert numpy.shares_memory(dbm.resall['A'].to_numpy(), dbm.resallBuffers[1])
+    numpy.testing.assert_array_equal(dbm.resall['B'].to_numpy()[-10:], new['B'].astype('float32').to_numpy())
+
+
+def test_resample_matches_fast_time_query(tmp_path):
+    dbm = manager(tmp_path)
+    dbm.importFromDataframe(sensors(5000), 'sensors', method='copy')
+    dbm.initFastTimeQuery(stream=True)
+    start, end = '2020-01-01 00:10:00', '2020-01-01 00:20:00'
+    for how in ['mean', 'min', 'max', 'last']:
+        sql = pd.DataFrame(dbm.timeQuery(start, end, columns=['A', 'B'], resample='1min', how=how).all())
+        memory = dbm.fastTimeQuery(start, end, resample='1min', how=how)
+        assert sql[TIME_COL].dtype == 'datetime64[ns]'
+        # both bounds are included : the bucket of end holds its single row
+        numpy.testing.assert_array_equal(sql[TIME_COL].to_numpy(), memory[TIME_COL].to_numpy())
+        assert len(sql) == 11
+        for c in ['A', 'B']:
+            numpy.testing.assert_allclose(sql[c].astype('float64'), memory[c], rtol=1e-6)
+
+
+def test_rollup_matches_raw_resample(tmp_path):
+    dbm = manager(tmp_path)
+    df = sensors(7200)
+    dbm.importFromDataframe(df, 'sensors', rollups=['1min'])
+    dbm.importFromDataframe(sensors(7200, start='2020-01-01 01:30:00', seed=1), 'sensors', ifExists='append', rollups=['1min'])
+    dbm.initFastTimeQuery(stream=True)
+    for start in ['2020-01-01 01:10:00', '2020-01-01 01:10:30']:
+        end = '2020-01-01 01:39:59'
+        rollup = pd.DataFrame(dbm.timeQuery(start, end, points=20).all())
+        raw = dbm.fastTimeQuery(pd.Timestamp(start).floor('1min'), end, resample='1min')
+        # the bucket starting at 01:10:00 is kept in both cases
+        assert rollup[TIME_COL].iloc[0] == pd.Timestamp('2020-01-01 01:10:00')
+        numpy.testing.assert_array_equal(pd.to_datetime(rollup[TIME_COL]).to_numpy(), raw[TIME_COL].to_numpy())
+        for c in ['A', 'B']:
+            numpy.testing.assert_allclose(rollup[c].astype('float64'), raw[c], rtol=1e-6)
@@ -0,0 +1,112 @@
+import numpy
+import pandas as pd
+
+from hdf5_manager import Hdf5Manager, SPARSE_MIN_GAP
+from hdf5_reader import Hdf5Reader
+
+
+def frame(n, start=0, **cols):
+    times = pd.date_range('2020-01-01', periods=n, freq='s') + pd.Timedelta(seconds=start)
+    return pd.DataFrame(dict({'TIME': times}, **cols))
+
+
+def test_sparse_many_runs(tmp_path):
+    # one value every SPARSE_MIN_GAP + 1 rows : one extent per value
+    path = str(tmp_path / 'sparse.h5')
+    n, nappends = 100000, 4
+    expected = []
+    with Hdf5Manager(path, sparse=True) as manager:
+        for k in range(nappends):
+            values = numpy.full(n, numpy.nan)
+            values[::SPARSE_MIN_GAP + 1] = numpy.arange(len(values[::SPARSE_MIN_GAP + 1])) + k
+            manager.addFromDataframe(frame(n, start=k * n, A=values))
+            expected.append(values)
+    expected = numpy.concatenate(expected)
+
+    reader = Hdf5Reader(path)
+    assert reader.h5file['extents']['A'].shape[0] > 5000
+    res = reader.timeQuery(None, None)
+    numpy.testing.assert_array_equal(res['A'].to_numpy(), expected)
+    window = reader.timeQueryArrays('2020-01-01 05:00:00', '2020-01-01 05:30:00', cols=['A'])
+    i0 = 5 * 3600
+    numpy.testing.assert_array_equal(window['A'], expected[i0:i0 + 1801])
+    reader.close()
+
+
+def test_contiguous_memory_mapped(tmp_path):
+    path = str(tmp_path / 'contiguous.h5')
+    first = frame(1000, A=numpy.random.rand(1000))
+    with Hdf5Manager(path, chunkSize=None) as manager:
+        manager.addFromDataframe(first)
+
+    reader = Hdf5Reader(path)
+    assert reader.h5columns['A'].chunks is None
+    assert set(reader.mmaps) == {'TIME', 'A'}
+    res = reader.timeQueryArrays(None, None)
+    assert isinstance(res['A'], numpy.memmap)
+    numpy.testing.assert_allclose(res['A'], first['A'].to_numpy(), rtol=1e-6)
+    reader.close()
+
+    second = frame(500, start=1000, A=numpy.random.rand(500), B=numpy.random.rand(500))
+    with Hdf5Manager(path, deleteIfExists=False, chunkSize=None) as manager:
+        manager.addFromDataframe(second)
+    reader = Hdf5Reader(path)
+    assert set(reader.mmaps) == {'TIME', 'A', 'B'}
+    res = reader.timeQuery(None, None)
+    numpy.testing.assert_allclose(res['A'].to_numpy(), numpy.r_[first['A'].to_numpy(), second['A'].to_numpy()], rtol=1e-6)
+    assert res['B'].isna().sum() == 1000
+    reader.close()
+
+
+def test_inferred_codec_widened(tmp_path):
+    # a totalizer : the first batch fits a scaled int16, the next ones do not
+    path = str(tmp_path / 'codecs.h5')
+    batches = [numpy.arange(900), numpy.arange(900) + 40000, numpy.arange(900) + 2**40]
+    with Hdf5Manager(path) as manager:
+        for k, values in enumerate(batches):
+            manager.addFromDataframe(frame(len(values), start=k * 900, A=values, B=numpy.random.rand(900).astype('float16')))
+        assert manager.h5columns['A'].attrs['codec'] == 'float64'
+    reader = Hdf5Reader(path)
+    numpy.testing.assert_array_equal(reader.timeQuery(None, None)['A'].to_numpy(), numpy.concatenate(batches))
+    reader.close()
+
+
+def test_delta_codec_widened(tmp_path):
+    path = str(tmp_path / 'delta.h5')
+    first = numpy.arange(0, 10**6, 100)
+    with Hdf5Manager(path, sparse=True) as manager:
+        manager.addFromDataframe(frame(len(first), A=first))
+        assert manager.h5columns['A'].attrs['codec'] == 'delta'
+        manager.addFromDataframe(frame(3, start=len(first), A=numpy.array([10**6, 2**40, 2**40 + 1])))
+        assert manager.h5columns['A'].attrs['codec'] == 'float64'
+        numpy.testing.assert_array_equal(manager.readColumn('A'), numpy.r_[first, 10**6, 2**40, 2**40 + 1])
+
+
+def test_delta_codec_counter_above_int32(tmp_path):
+    # a totalizer starting beyond int32 : each block is seeded with its first value
+    path = str(tmp_path / 'counter.h5')
+    rng = numpy.random.default_rng(0)
+    values = 2**31 + 3 * 10**9 + numpy.cumsum(rng.integers(0, 100, 10000))
+    with Hdf5Manager(path) as manager:
+        for start in range(0, len(values), 3000):
+            manager.addFromDataframe(frame(len(values[start:start + 3000]), start=start, A=values[start:start + 3000]))
+            assert manager.h5columns['A'].attrs['codec'] == 'delta'
+    reader = Hdf5Reader(path)
+    numpy.testing.assert_array_equal(reader.timeQuery(None, None)['A'].to_numpy(), values)
+    times = pd.date_range('2020-01-01', periods=len(values), freq='s')
+    window = reader.timeQuery(times[5000], times[9000])['A'].to_numpy()
+    numpy.testing.assert_array_equal(window, values[5000:9001])
+    reader.close()
+
+
+def test_large_floats_stay_float64(tmp_path):
+    # float32 keeps 1e-6 relative error but loses units beyond 2**24
+    path = str(tmp_path / 'floats.h5')
+    values = 1e8 + numpy.arange(1000) + 0.5
+    with Hdf5Manager(path) as manager:
+        manager.addFromDataframe(frame(len(values), A=values, B=numpy.arange(1000) / 8))
+        assert manager.h5columns['A'].attrs['codec'] == 'float64'
+        assert manager.h5columns['B'].attrs['codec'] == 'float32'
+        manager.addFromDataframe(frame(len(values), start=len(values), A=values, B=values))
+        assert manager.h5columns['B'].attrs['codec'] == 'float64'
+        numpy.testing.assert_array_equal(manager.readColumn('B'), numpy.r_[numpy.arange(1000) / 8, values])
@@ -0,0 +1,102 @@
+import json
+import os
+import pickle
+
+import pytest
+
+import quality_engine
+from quality_engine import QualityEngine, MANIFEST_FILE
+
+
+HEADER = '| Lot contrôle | Article | Date | Valeur |'
+
+
+def write_export(path, rows, header=HEADER):
+    # préambule, entête et séparateur d'un export SAP
+    with open(path, 'w', encoding='latin-1') as fd:
+        fd.write('18.10.2026   Liste dynamique   1\nPage 1\n' + '-' * 50 + '\n')
+        fd.write(header + '\n|' + '-' * 50 + '|\n')
+        for row in rows:
+            fd.write('| ' + ' | '.join(row) + ' |\n')
+
+
+def run_engine(monkeypatch, input_path, output_path, **kwargs):
+    monkeypatch.setenv('INPUT_QUALITY_FILE_PATH', str(input_path) + os.sep)
+    monkeypatch.setenv('OUTPUT_QUALITY_FILE_PATH', str(output_path))
+    engine = QualityEngine(store_option='parquet', parser='c', **kwargs)
+    engine.run()
+    return engine
+
+
+@pytest.mark.parametrize('workers, chunksize', [(1, None), (2, 2)])
+def test_conflicting_exports(tmp_path, monkeypatch, workers, chunksize):
+    # Valeur est décimale dans le premier export, texte ('n/a') dans le second
+    input_path = tmp_path / 'exports'
+    input_path.mkdir()
+    output_path = tmp_path / 'store'
+    write_export(input_path / 'export_a.txt', [('0001', 'M1', '01.02.2020', '1,5'),
+                                               ('0002', 'M1', '02.02.2020', '2'),
+                                               ('0003', 'M2', '03.02.2020', '3,25')])
+    run_engine(monkeypatch, input_path, output_path, workers=workers, chunksize=chunksize)
+    engine = run_engine(monkeypatch, input_path, output_path, workers=workers, chunksize=chunksize)
+    assert engine.query()['Valeur'].tolist() == [1.5, 2.0, 3.25]
+
+    write_export(input_path / 'export_b.txt', [('0004', 'M1', '01.03.2020', 'n/a'),
+                                               ('0005', 'M3', '02.03.2020', '4')])
+    engine = run_engine(monkeypatch, input_path, output_path, workers=workers, chunksize=chunksize)
+    df = engine.query()
+    assert df['Valeur'].tolist() == ['1,5', '2', '3,25', 'n/a', '4']
+    assert df['Date'].dt.month.tolist() == [2, 2, 2, 3, 3]
+    assert engine.query(lots=['0002', '0004'], columns=['Valeur'])['Valeur'].tolist() == ['2', 'n/a']
+
+    with open(os.path.join(str(output_path), MANIFEST_FILE)) as fd:
+        manifest = json.load(fd)
+    assert {sig['kinds']['Valeur'] for sig in manifest.values()} == {'text'}
+
+
+def test_pickle_store_keeps_object_columns(tmp_path, monkeypatch):
+    # le pickle garde le typage historique (object) que les exports soient parsés en séquentiel ou par process
+    input_path = tmp_path / 'exports'
+    input_path.mkdir()
+    for k in range(2):
+        write_export(input_path / 'export_{}.txt'.format(k), [('000{}'.format(i), 'M1', '01.02.2020', '1,5')
+                                                               for i in range(4)])
+    monkeypatch.setenv('INPUT_QUALITY_FILE_PATH', str(input_path) + os.sep)
+    frames = []
+    for workers in [1, 2]:
+        output = tmp_path / 'quality_{}.pickle'.format(workers)
+        monkeypatch.setenv('OUTPUT_QUALITY_FILE_PATH', str(output))
+        QualityEngine(store_option='pickle', workers=workers).run()
+        with open(str(output), 'rb') as fd:
+            frames.append(pickle.load(fd))
+    for df in frames:
+        assert (df.dtypes == object).all()
+    assert frames[0].equals(frames[1])
+
+
+def test_query_filter_columns(tmp_path, monkeypatch):
+    # export dont les colonnes ne sont pas LOT_COL / MATERIAL_COL / DATE_COL
+    input_path = tmp_path / 'exports'
+    input_path.mkdir()
+    output_path = tmp_path / 'store'
+    write_export(input_path / 'export_a.txt', [('0001', 'M1', '01.02.2020', '1'),
+                                               ('0002', 'M2', '02.02.2020', '2'),
+                                               ('0003', 'M1', '03.03.2020', '3')],
+                 header='| Lot | Matériau | Date création | Valeur |')
+    engine = run_engine(monkeypatch, input_path, output_path)
+    df = engine.query(columns=['Valeur'], materials='M1', end='2020-03-01',
+                      material_col='Matériau', date_col='Date création')
+    assert df['Valeur'].tolist() == [1]
+    assert engine.query(lots=['0002'], lot_col='Lot')['Valeur'].tolist() == [2]
+    with pytest.raises(ValueError, match='Date'):
+        engine.query(start='2020-02-01')
+    with pytest.raises(ValueError, match='Poids'):
+        engine.query(columns=['Poids'])
+
+
+def test_parquet_store_needs_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setenv('INPUT_QUALITY_FILE_PATH', str(tmp_path) + os.sep)
+    monkeypatch.setenv('OUTPUT_QUALITY_FILE_PATH', str(tmp_path / 'store'))
+    monkeypatch.setattr(quality_engine, 'pa', None)
+    with pytest.raises(ImportError, match='pyarrow'):
+        QualityEngine(store_option='parquet')
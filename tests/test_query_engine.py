@@ -0,0 +1,149 @@
+import importlib.util
+import json
+import os
+import sys
+import types
+
+import pytest
+
+# pickle_reader et events_engine ne sont pas dans le dépôt, QueryEngine n'en utilise que le constructeur
+for name in ['pickle_reader', 'events_engine']:
+    if name not in sys.modules and importlib.util.find_spec(name) is None:
+        stub = types.ModuleType(name)
+        stub.PickleReader = stub.EventsEngine = type('Stub', (), {})
+        sys.modules[name] = stub
+
+import query_engine
+from query_engine import QueryEngine, CACHE_FILE, iter_json_array
+
+
+WORDS = ['VANNE', 'POMPE', 'CUVE', 'CHAUFFE', 'ÉVAPORATEUR', 'SÉCHEUR → 2']
+
+
+def recipe_tree(nlots=2):
+    """
+    arbre des recettes : etapes, sequences, operations, fonctions dont les ids commencent par l'id du parent
+    """
+    colls = {'ETAPES': [], 'SEQUENCES': [], 'OPERATIONS': [], 'FONCTIONS': []}
+    for l in range(nlots):
+        for e in range(2):
+            eid = 'L{:02d}_E{:02d}'.format(l, e)
+            colls['ETAPES'].append({'id': eid, 'lib': eid})
+            for s in range(2):
+                sid = eid + '_S{:02d}'.format(s)
+                colls['SEQUENCES'].append({'id': sid, 'etape_associee': eid, 'temps_executer': {'$date': l * 100 + s},
+                                           'modifications': 'D1.{} {} {}'.format(s + 1, WORDS[(l + s) % 6], sid)})
+                for o in range(2):
+                    oid = sid + '_O{:02d}'.format(o)
+                    colls['OPERATIONS'].append({'id': oid, 'etape_associee': eid,
+                                                'modifications': 'D2.{} {} {}'.format(o + 1, WORDS[(e + o) % 6], oid)})
+                    for f in range(3):
+                        colls['FONCTIONS'].append({'id': oid + '_F{:02d}'.format(f), 'temps_terminer': {'$date': 5},
+                                                   'modifications': 'D3 {} {}'.format(WORDS[f + 3], oid + str(f))})
+    colls['RECETTES'] = [{'id': 'R1', 'lib': 'Recette é'}]
+    colls['CAPTEURS'] = [{'nom': 'C{:02d}'.format(i), 'unite': 'bar', 'type': 'P'} for i in range(5)]
+    colls['OPERATEURS'] = [{'lib': e['id'], 'creation': 'u{}'.format(i), 'user': 'Opérateur {}'.format(i),
+                            'date0': '01/01/2026 10:00:00', 'date1': '01/01/2026 11:00:00'}
+                           for i, e in enumerate(colls['ETAPES'])]
+    return colls
+
+
+def write_tree(folder, colls):
+    # un document json par fichier, sur une ligne, comme les exports lus par getDb
+    folder.mkdir(exist_ok=True)
+    for name, records in colls.items():
+        with open(str(folder / (name + '.json')), 'w', encoding='utf-8') as fo:
+            fo.write(json.dumps(records, ensure_ascii=False) + '\n')
+
+
+def engine(monkeypatch, folder, **kwargs):
+    monkeypatch.setenv('JSON_FILE_PATH', str(folder))
+    return QueryEngine(**kwargs)
+
+
+def test_stream_parser_matches_json(tmp_path, monkeypatch):
+    colls = recipe_tree()
+    write_tree(tmp_path / 'json', colls)
+    write_tree(tmp_path / 'stream', colls)
+    # BASE.jsonl est préféré en mode stream
+    with open(str(tmp_path / 'stream' / 'FONCTIONS.jsonl'), 'w', encoding='utf-8') as fo:
+        for r in colls['FONCTIONS']:
+            fo.write(json.dumps(r, ensure_ascii=False) + '\n')
+    ref = engine(monkeypatch, tmp_path / 'json')
+    res = engine(monkeypatch, tmp_path / 'stream', json_parser='stream')
+    assert res.global_dict == ref.global_dict
+    assert res.list_id == ref.list_id
+    assert res.list_modif == ref.list_modif
+    assert res.modif_dict == ref.modif_dict
+    assert ref.get_element_by_id('L01_E00_S01')['modifications'] == '{} L01_E00_S01'.format(WORDS[2])
+
+    kept = engine(monkeypatch, tmp_path / 'json', keep_fields=query_engine.QUERY_FIELDS)
+    assert 'lib' not in kept.global_dict['L00_E00']
+    assert {k: v['modifications'] for k, v in kept.global_dict.items() if 'modifications' in v} == \
+        {k: v['modifications'] for k, v in ref.global_dict.items() if 'modifications' in v}
+
+
+def test_cache_refreshed_after_source_edit(tmp_path, monkeypatch):
+    colls = recipe_tree()
+    folder = tmp_path / 'json'
+    write_tree(folder, colls)
+    first = engine(monkeypatch, folder)
+    assert os.path.isfile(str(folder / CACHE_FILE))
+
+    colls['SEQUENCES'][0]['modifications'] = 'D1.1 RINÇAGE L00_E00_S00'
+    write_tree(folder, colls)
+    second = engine(monkeypatch, folder)
+    assert second.get_element_by_id('L00_E00_S00')['modifications'] == 'RINÇAGE L00_E00_S00'
+    assert second.get_by_modifications_rapid('RINÇAGE L00_E00_S00') == [second.global_dict['L00_E00_S00']]
+    assert first.modif_dict.keys() - second.modif_dict.keys() == {'{} L00_E00_S00'.format(WORDS[0])}
+
+    # cache illisible : reconstruit depuis les json
+    with open(str(folder / CACHE_FILE), 'wb') as fo:
+        fo.write(b'\x00corrompu')
+    third = engine(monkeypatch, folder)
+    assert third.global_dict == second.global_dict
+
+
+def test_lazy_collections_and_indexes(tmp_path, monkeypatch):
+    colls = recipe_tree()
+    write_tree(tmp_path, colls)
+    qe = engine(monkeypatch, tmp_path)
+    # capteurs et operateurs sont chargés par buildIndexes, recettes seulement à son premier accès
+    assert 'recettes' not in qe.__dict__
+    assert qe.filter_map('recettes', mapfunc=lambda r: r['lib'], flatten=False) == ['Recette é']
+    assert 'recettes' in qe.__dict__
+    with pytest.raises(AttributeError):
+        qe.inconnue
+
+    assert qe.get_unite_type('C03') == ['bar', 'P']
+    assert qe.get_operateur_of_etape('L01_E01', fullname=True) == ['Opérateur 3']
+    assert qe.get_children_ids('L00_E01', 'sequences') == ['L00_E01_S00', 'L00_E01_S01']
+    assert [r['id'] for r in qe.get_fonctions_by_parent_id('L01_E00_S01_O00')] == \
+        ['L01_E00_S01_O00_F0{}'.format(f) for f in range(3)]
+    tree = qe.get_subtree('L00_E00', max_level='operations')
+    assert [s['element']['id'] for s in tree['children']] == ['L00_E00_S00', 'L00_E00_S01']
+    assert all(o['children'] == [] for s in tree['children'] for o in s['children'])
+
+    # recherche par suffixe : même résultat qu'un parcours de toutes les modifications
+    for suffix in ['S00', 'O01', '10', WORDS[5] + ' L01_E01_S00', 'absent']:
+        expected = sorted(m for base in query_engine.MODIF_COLLECTIONS for m in qe.list_modif[base] if m.endswith(suffix))
+        assert sorted(r['modifications'] for r in qe.get_by_modifications_rapid(suffix, exactmatch=False)) == expected
+    assert qe.get_by_modifications_rapid('absent') == []
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 20])
+def test_iter_json_array(tmp_path, chunk_size):
+    records = [{'id': 'é→{}'.format(i), 'v': 12345.678 * i, 'l': [1, -2, True, None]} for i in range(20)]
+    fpath = str(tmp_path / 'array.json')
+    with open(fpath, 'w', encoding='utf-8') as fo:
+        fo.write(' [ ' + ' ,\n'.join(json.dumps(r, ensure_ascii=False) for r in records) + ' ]\n')
+    assert list(iter_json_array(fpath, chunk_size=chunk_size)) == records
+
+    with open(fpath, 'w', encoding='utf-8') as fo:
+        fo.write(json.dumps(records)[:-5])
+    with pytest.raises(ValueError):
+        list(iter_json_array(fpath, chunk_size=chunk_size))
+    with open(fpath, 'w', encoding='utf-8') as fo:
+        fo.write('{"id": 1}')
+    with pytest.raises(ValueError):
+        list(iter_json_array(fpath, chunk_size=chunk_size))